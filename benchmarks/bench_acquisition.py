@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    End to end benchmark of acquisition for each MPCS device class.
+
+    For LIFT_COIL, PICKUP_COILS and TOF_SENSORS in turn, a scratch tree
+    on local disk gets one instance of the device, then for 1x, 10x and
+    100x of its RATE the simulator sends to it for a few seconds between
+    START and STOP.  Each run reports the sustained storage throughput,
+    the rate the simulator actually managed to send at, which at 100x
+    PICKUP_COILS can fall short of the rate asked for, and the p50 /
+    p99 / p99.9 latency from a message arriving to its segment write
+    returning, as JSON:
+
+        python benchmarks/bench_acquisition.py [--duration 5] [--output results.json]
+
+    MDS_PYDEVICE_PATH must include this directory.
+
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MDSplus
+import numpy as np
+
+import mpcs_acquisition
+import mpcs_dispatch
+import mpcs_simulator
+
+TREE = 'mpcsbench'
+MULTIPLIERS = (1, 10, 100)
+PORT = 45000
+SETTLE = 0.5
+
+def build_tree(directory):
+    """ a model tree with one instance of each device, sending to localhost """
+    os.environ['%s_path' % TREE] = directory
+    tree = MDSplus.Tree(TREE, -1, 'NEW')
+    for n, model in enumerate(sorted(mpcs_dispatch.MODELS)):
+        head = tree.addDevice(model[:12], model)
+        for path, value in (('.COMMS:ADDRESS', '127.0.0.1'), ('.COMMS:PORT', PORT + n)):
+            node = head.getNode(path)
+            node.write_once = False
+            node.record = value
+            node.write_once = True
+    tree.write()
+    tree.close()
+
+def percentiles(latency):
+    if len(latency) == 0:
+        return {}
+    latency = np.concatenate(latency)
+    p50, p99, p999 = np.percentile(latency, [50, 99, 99.9])
+    return {'p50': p50, 'p99': p99, 'p99.9': p999, 'max': float(latency.max())}
+
+def run_one(shot, path, model, multiplier, duration):
+    MDSplus.Tree(TREE, -1).createPulse(shot)
+    tree = MDSplus.Tree(TREE, shot)
+    dev = mpcs_dispatch.MODELS[model](tree.getNode(path))
+    contract = mpcs_simulator.Contract.from_device(dev)
+    mpcs_acquisition.Acquisition.record_latency = True
+    dev.CONFIG()
+    dev.START()
+    acq = mpcs_acquisition.active(dev)
+    stream = mpcs_simulator.Stream(contract, multiplier, duration=duration)
+    started = time.time()
+    stream.start()
+    stream.join()
+    elapsed = time.time() - started
+    time.sleep(SETTLE)
+    stream.stop()
+    fault = None
+    try:
+        dev.STOP()
+    except Exception as e:
+        fault = str(e)
+    result = {
+        'model': model,
+        'multiplier': multiplier,
+        'rate': contract.rate * multiplier,
+        'seconds': elapsed,
+        'sent': stream.sent,
+        'sent_rate': stream.sent / elapsed,
+        'received': acq.received,
+        'lost': acq.lost,
+        'late': acq.late,
+        'missing': acq.missing,
+        'stored': acq.samples,
+        'start_delay': acq.start_delay,
+        'throughput': acq.samples / elapsed,
+        'latency': percentiles(acq.latency),
+        'fault': fault,
+    }
+    return result
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark MPCS acquisition')
+    parser.add_argument('--duration', type=float, default=5., help='seconds per run')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch tree')
+    args = parser.parse_args(argv[1:])
+    directory = tempfile.mkdtemp(prefix='mpcsbench')
+    results = []
+    try:
+        build_tree(directory)
+        devices = mpcs_dispatch.find_devices(MDSplus.Tree(TREE, -1, 'ReadOnly'))
+        shot = 1
+        for path, model in devices:
+            for multiplier in MULTIPLIERS:
+                results.append(run_one(shot, path, model, multiplier, args.duration))
+                shot += 1
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    report = {'time': time.time(), 'duration': args.duration, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print('')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,75 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Compare loading a device's parameters one node at a time with
+    mpcs_parameters.load, locally and through an mdsip server.
+
+        python benchmarks/bench_parameters.py TREE SHOT DEVICE_PATH [HOST]
+
+    For the mdsip case start a local server first, e.g. mdsip -p 8000
+    -m, and pass localhost:8000 as HOST.
+
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MDSplus
+
+import mpcs_parameters
+
+def timed(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main(argv):
+    if len(argv) < 4:
+        print(__doc__)
+        return 1
+    tree = MDSplus.Tree(argv[1], int(argv[2]), 'ReadOnly')
+    dev = tree.getNode(argv[3])
+    connection = None
+    if len(argv) > 4:
+        connection = MDSplus.Connection(argv[4])
+        connection.openTree(argv[1], int(argv[2]))
+    each, by_node = timed(lambda: mpcs_parameters.load_each(dev, connection), 10)
+    bulk, by_bulk = timed(lambda: mpcs_parameters.load(dev, connection), 10)
+    if sorted(by_node) != sorted(by_bulk):
+        print('parameter names differ: %s' % (sorted(set(by_node) ^ set(by_bulk)),))
+    print('%d parameters via %s' % (len(by_bulk), argv[4] if connection else 'local tree'))
+    print('  one node at a time  %8.2f ms' % (each * 1e3,))
+    print('  single evaluation   %8.2f ms' % (bulk * 1e3,))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
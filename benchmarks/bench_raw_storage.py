@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Disk footprint and read back speed of the PICKUP_COILS storage modes.
+
+    A few seconds of 10 kHz, 3 channel pickup data (a sine with a few
+    counts of noise on each channel) are written to a scratch tree with
+    a SegmentWriter, one shot per mode:
+
+        float64         the HAL output as double
+        float32         the HAL output as PHYS_TYPE float
+        int16           the raw shorts, HAL applied on read
+        int16-compress  the same with compressed segments
+
+    and then read back through the FLUX node, so the raw modes include
+    evaluating the HAL expression.  Results are JSON:
+
+        python benchmarks/bench_raw_storage.py [--seconds 10] [--output results.json]
+
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MDSplus
+import numpy as np
+
+import mpcs_hal
+import mpcs_segments
+import mpcs_simulator
+
+TREE = 'mpcsraw'
+RATE = 10000.
+CHANNELS = 3
+SEG_LENGTH = 10000
+BLOCK = 1000
+HAL = '_out := _in * [1E-4, 1E-4, 2E-4] + [0., .5, -.5]'
+MODES = (('float64', np.float64, False), ('float32', np.float32, False),
+         ('int16', np.int16, False), ('int16-compress', np.int16, True))
+
+def build_tree(directory):
+    os.environ['%s_path' % TREE] = directory
+    tree = MDSplus.Tree(TREE, -1, 'NEW')
+    tree.addNode('FLUX', 'SIGNAL')
+    tree.addNode('RAW', 'SIGNAL')
+    tree.write()
+    tree.close()
+
+def raw_samples(seconds):
+    seq = np.arange(int(seconds * RATE), dtype=np.uint64)
+    raw = mpcs_simulator.waveform(seq, RATE, (CHANNELS,), np.int16)
+    noise = np.random.RandomState(0).randint(-8, 9, raw.shape)
+    return seq, (raw + noise).astype(np.int16)
+
+def run_one(directory, shot, mode, dtype, compress, seq, raw):
+    MDSplus.Tree(TREE, -1).createPulse(shot)
+    tree = MDSplus.Tree(TREE, shot)
+    flux = tree.getNode('FLUX')
+    kernel = mpcs_hal.compile_hal(HAL)
+    started = time.time()
+    if dtype == np.int16:
+        node = tree.getNode('RAW')
+        node.compress_segments = compress
+        writer = mpcs_segments.SegmentWriter(node, RATE, 0., SEG_LENGTH, (CHANNELS,), np.int16)
+        for first in range(0, len(seq), BLOCK):
+            writer.put(seq[first:first + BLOCK], raw[first:first + BLOCK])
+        writer.close()
+        scale, offset = mpcs_hal.affine(kernel, (CHANNELS,), np.int16, np.float32)
+        flux.record = mpcs_hal.read_expression(node, scale, offset)
+    else:
+        writer = mpcs_segments.SegmentWriter(flux, RATE, 0., SEG_LENGTH, (CHANNELS,), dtype)
+        for first in range(0, len(seq), BLOCK):
+            writer.put(seq[first:first + BLOCK], kernel(raw[first:first + BLOCK]).astype(dtype))
+        writer.close()
+    written = time.time() - started
+    tree.close()
+    size = os.path.getsize(os.path.join(directory, '%s_%03d.datafile' % (TREE, shot)))
+    tree = MDSplus.Tree(TREE, shot, 'ReadOnly')
+    started = time.time()
+    record = tree.getNode('FLUX').record
+    data = record.data()
+    times = record.dim_of().data()
+    read = time.time() - started
+    expected = kernel(raw).astype(np.float32)
+    return {
+        'mode': mode,
+        'bytes': size,
+        'bytes_per_sample': size / float(len(seq)),
+        'write_seconds': written,
+        'read_seconds': read,
+        'max_error': float(np.max(np.abs(np.reshape(data, expected.shape) - expected))),
+        'samples_read': len(times),
+    }
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark raw and physical storage of PICKUP_COILS data')
+    parser.add_argument('--seconds', type=float, default=10., help='seconds of 10 kHz data per mode')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args(argv[1:])
+    directory = tempfile.mkdtemp(prefix='mpcsraw')
+    seq, raw = raw_samples(args.seconds)
+    results = []
+    try:
+        build_tree(directory)
+        for shot, (mode, dtype, compress) in enumerate(MODES, 1):
+            results.append(run_one(directory, shot, mode, dtype, compress, seq, raw))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    report = {'time': time.time(), 'seconds': args.seconds, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print('')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
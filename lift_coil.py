@@ -26,6 +26,14 @@ import MDSplus
 import time
 import datetime
 import numpy as np
+
+import mpcs_acquisition
+import mpcs_contract
+import mpcs_derived
+import mpcs_diagnostics
+import mpcs_parameters
+import mpcs_publisher
+
 class LIFT_COIL(MDSplus.Device):
     """
 
@@ -56,11 +64,33 @@ class LIFT_COIL(MDSplus.Device):
        SDN
 
     Methods:
-       check - make sure Recipe matches, what else
+       check - make sure Recipe matches, compares the FINGERPRINT
+               stored by Add with PCS_PRINT, the one from PCS
+       verify - recompute the FINGERPRINT from the immutable
+               parameters and compare it with the stored one
        configure
        start
        stop
 
+    CONFIG arms the acquisition so that START only has to set it
+    running, and STOP finishes it, see mpcs_acquisition.
+
+    START begins acquisition, the values are stored in
+    SIGNALS:DEMAND as segments of SIGNALS:SEG_LENGTH samples until STOP.
+
+    DEMAND:MIN_10, MAX_10, MEAN_10 and so on to MEAN_1000 hold the min,
+    max and mean of each 10, 100 and 1000 samples, for browsing with
+    mpcs_derived.read().
+
+    If PARAMETERS.MUTTABLE:PROGRAM has values CONFIG also sets up a
+    publisher for them and START starts it sending them as the demand,
+    one per tick of RATE; STOP stores the lateness of each send in
+    SIGNALS:DEMAND:JITTER.
+
+    The immutable parameters are also typed properties, rate, phase,
+    raw_shape, turns, r, z, direction and so on, loaded once per open
+    of the tree.
+
     debugging() - is debugging enabled.
                   Controlled by environment variable DEBUG_DEVICES
     """
@@ -78,6 +108,18 @@ class LIFT_COIL(MDSplus.Device):
           'options': ('write_once', 'no_write_shot',),
           'help':'The GUID of this instance.'
         },
+        {
+          'path': ':FINGERPRINT',
+          'type': 'text',
+          'options': ('write_once', 'no_write_shot',),
+          'help':'sha256 of GUID and the immutable parameters, set by Add'
+        },
+        {
+          'path': ':PCS_PRINT',
+          'type': 'text',
+          'options': ('no_write_model', 'write_once',),
+          'help':'FINGERPRINT of the contract as PCS has it, written by PCS before CHECK'
+        },
         {
           'path': ':NAME',
           'type': 'text',
@@ -179,6 +221,12 @@ class LIFT_COIL(MDSplus.Device):
           'options': ('no_write_shot',), 
           'help': 'Power Supply Voltage Setting'
         },
+        {
+          'path': '.PARAMETERS.MUTTABLE:PROGRAM',
+          'type': 'numeric',
+          'options': ('no_write_shot',),
+          'help': 'Demand values to send at RATE from START, if PCS is not sending them'
+        },
         {
           'path': '.SIGNALS',
           'type': 'structure'
@@ -196,6 +244,12 @@ class LIFT_COIL(MDSplus.Device):
           'options': ('no_write_shot',),
           'help':'Expression to make values from demand voltages'
         },
+        {
+          'path': '.SIGNALS:DEMAND:JITTER',
+          'type': 'signal',
+          'options': ('no_write_model', 'write_once',),
+          'help':'Lateness in seconds of each demand sent from PROGRAM'
+        },
         {
           'path': '.SIGNALS:MAX_MISSING',
           'type': 'numeric',
@@ -217,7 +271,7 @@ class LIFT_COIL(MDSplus.Device):
         {
           'path': '.COMMS:ADDRESS',
           'type': 'text',
-          'value': '244.0.0.0',
+          'value': '239.0.0.1',
           'options': ('no_write_shot','write_once',),
           'help':'Multicast address'
         },
@@ -258,7 +312,18 @@ class LIFT_COIL(MDSplus.Device):
           'valueExpr': "Action(Dispatch('S','DONE',50,None),Method(None,'STOP',head))", 
           'options': ('no_write_shot',)
         },
-    ]
+    ] + mpcs_derived.pyramid_parts('.SIGNALS:DEMAND') + mpcs_diagnostics.parts(500)
+
+    rate = mpcs_parameters.Parameter('RATE', float)
+    phase = mpcs_parameters.Parameter('PHASE', float)
+    raw_shape = mpcs_parameters.Parameter('RAW_SHAPE', mpcs_contract.shape_of)
+    raw_type = mpcs_parameters.Parameter('RAW_TYPE', str)
+    phys_shape = mpcs_parameters.Parameter('PHYS_SHAPE', mpcs_contract.shape_of)
+    phys_type = mpcs_parameters.Parameter('PHYS_TYPE', str)
+    direction = mpcs_parameters.Parameter('DIRECTION', str)
+    turns = mpcs_parameters.Parameter('TURNS', int)
+    r = mpcs_parameters.Parameter('R', float)
+    z = mpcs_parameters.Parameter('Z', float)
 
     debug = None
 
@@ -273,6 +338,7 @@ class LIFT_COIL(MDSplus.Device):
         import uuid
         head = super(LIFT_COIL, LIFT_COIL).Add(*a, **ka)
         head.this_guid.record = str(uuid.uuid4())
+        head.fingerprint.record = mpcs_contract.contract_fingerprint(head, LIFT_COIL.parts)
         for node in head.getConglomerateNodes():
             if not node == head:
                 if node.no_write_shot and node.write_once:
@@ -280,3 +346,36 @@ class LIFT_COIL(MDSplus.Device):
                     node.setExtendedAttribute('Muttable', 0)
                     node.write_once = True
         return head
+
+    def CHECK(self, expected=None):
+        mpcs_contract.check(self, expected)
+
+    def VERIFY(self):
+        mpcs_contract.verify(self, LIFT_COIL.parts)
+
+    def CONFIG(self):
+        import mpcs_dispatch
+        mpcs_dispatch.config(self)
+
+    def arm(self):
+        mpcs_acquisition.configure(self, self.signals_demand, self.signals_demand_hal,
+                                   derived=mpcs_derived.pyramid(self.signals_demand))
+        program = self.program()
+        if program is not None:
+            mpcs_publisher.configure(self, program)
+
+    def program(self):
+        try:
+            return self.parameters_muttable_program.data()
+        except MDSplus.TreeNODATA:
+            return None
+
+    def START(self):
+        if not mpcs_acquisition.armed(self):
+            self.arm()
+        mpcs_acquisition.start(self)
+        mpcs_publisher.start(self)
+
+    def STOP(self):
+        mpcs_publisher.stop(self, self.signals_demand_jitter)
+        mpcs_acquisition.stop(self)
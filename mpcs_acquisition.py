@@ -0,0 +1,465 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Acquisition of one MPCS data contract.
+
+    The CONFIG of each MPCS device does all of the setup with
+    configure(dev, ...): it checks the contract, compiles the HAL,
+    subscribes to COMMS:ADDRESS/PORT with a SharedRing, a ring buffer
+    in shared memory, and starts a writer process that attaches to it
+    by name, opens the tree and allocates its segments, then reports
+    back that it is ready.  The first CONFIG of a shot arms every
+    device of its action server at once, see mpcs_dispatch.config(),
+    and START arms a device that was not.  START only sets the ring
+    running and notes the time; .DIAGNOSTICS:START_DELAY is how long
+    after that the first sample was stored.
+
+    The receiver in this process only ever advances the ring's head,
+    the writer its tail, so blocks pass between them with no lock and
+    nothing pickled.  Every PERIOD the writer drains the ring, applies
+    the selectors and HAL, fills short holes in the sequence with a
+    GapDetector and appends the block to the signal with a
+    SegmentWriter, along with any mpcs_derived signals computed from
+    it.  A writer that stalls leaves messages waiting in the ring,
+    which shows in .DIAGNOSTICS:PEAK_OCCUP and OCCUPANCY; only a
+    stall longer than RING_SECONDS loses messages.
+
+    Given a raw node, the writer stores the selected raw samples there
+    instead, optionally with compressed segments, and at STOP makes the
+    signal a TDI expression that applies the HAL's scale and offset on
+    read.  The HAL must then be affine per channel and GAP_FILL hold.
+
+    STOP flags the writer to flush whatever is left, close the last
+    segment, store the holes found in SIGNALS:GAPS and fill in
+    .DIAGNOSTICS with the message counts, the ring occupancy (how far
+    the writer fell behind), the delay from START to the first stored
+    sample and latency histograms of the shot, then raises if more
+    than MAX_MISSING samples were missing or the writer failed.  The
+    device parts for these nodes come from mpcs_diagnostics.parts().
+
+    Device methods usually run in the Python embedded in an action
+    server, whose sys.executable is the server rather than Python, so
+    the writer is started with MPCS_PYTHON from the environment, see
+    writer_context().
+
+    configure(dev, ...), start(dev) and stop(dev) are called from the
+    device methods, the armed and running acquisitions are kept in a
+    table keyed by tree, shot and device nid since every action gets a
+    new device instance.
+
+"""
+import atexit
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+import MDSplus
+import numpy as np
+
+import mpcs_contract
+import mpcs_diagnostics
+import mpcs_gaps
+import mpcs_hal
+import mpcs_parameters
+import mpcs_receiver
+import mpcs_segments
+
+RING_SECONDS = 10.
+PERIOD = 0.1
+FIRST_PERIOD = 0.001
+CONTEXT = 'spawn'
+PYTHON = os.environ.get('MPCS_PYTHON')
+
+_active = {}
+
+def key(dev):
+    return (str(dev.tree.tree), int(dev.tree.shot), int(dev.nid))
+
+def selector(params, selectors):
+    """ SELECTORS as an index into each received sample, or None """
+    if selectors is None:
+        return None
+    return mpcs_contract.selector(selectors, params['RAW_SHAPE'], params['PHYS_SHAPE'])
+
+def hal_kernel(params, hal, selectors=None, debug=False):
+    """ the compiled (and cached) HAL kernel for this device """
+    raw_shape = mpcs_contract.shape_of(params['RAW_SHAPE'])
+    if selectors is not None:
+        raw_shape = (len(np.atleast_1d(selectors)),)
+    raw_type = mpcs_contract.raw_dtype(params['RAW_TYPE'])
+    kernel = mpcs_hal.kernel(hal, raw_shape, raw_type, mpcs_contract.raw_dtype(params['PHYS_TYPE']), debug)
+    shape = np.shape(kernel(mpcs_hal.probe(raw_shape, raw_type)))[1:]
+    if shape != mpcs_contract.shape_of(params['PHYS_SHAPE']):
+        raise ValueError('%s gives samples of shape %s, not PHYS_SHAPE %s' %
+                         (hal.path, shape, mpcs_contract.shape_of(params['PHYS_SHAPE'])))
+    return kernel
+
+def decoder(dev, params, selectors=None):
+    """ validate the contract and return its Decoder """
+    mpcs_contract.validate(params, selectors)
+    return mpcs_contract.decoder(mpcs_contract.comms_name(dev), params['RAW_SHAPE'], params['RAW_TYPE'])
+
+def gap_detector(max_missing, fill, params, raw=False):
+    return mpcs_gaps.GapDetector(max_missing, fill, mpcs_contract.raw_dtype(params['RAW_TYPE' if raw else 'PHYS_TYPE']))
+
+def raw_storage(params, kernel, selectors, fill):
+    """
+    Scale and offset of the HAL when the raw samples are stored and the
+    HAL applied on read, see mpcs_hal.affine.
+    """
+    if str(fill).strip().lower() != 'hold':
+        raise ValueError('Storing raw samples needs GAP_FILL hold, not %s' % (fill,))
+    shape = mpcs_contract.shape_of(params['RAW_SHAPE'])
+    if selectors is not None:
+        shape = (len(np.atleast_1d(selectors)),)
+    return mpcs_hal.affine(kernel, shape, mpcs_contract.raw_dtype(params['RAW_TYPE']),
+                           mpcs_contract.raw_dtype(params['PHYS_TYPE']))
+
+def settings(dev, signal, hal, selectors=None, derived=None, raw=None, compress=False):
+    """ everything the writer process needs, as plain picklable values """
+    return {
+        'tree': str(dev.tree.tree),
+        'shot': int(dev.tree.shot),
+        'head': str(dev.fullpath),
+        'signal': str(signal.fullpath),
+        'hal': str(hal.fullpath),
+        'gaps': str(dev.signals_gaps.fullpath),
+        'name': mpcs_contract.comms_name(dev),
+        'params': mpcs_parameters.load(dev),
+        'selectors': None if selectors is None else np.asarray(selectors),
+        'seg_length': int(dev.signals_seg_length.data()),
+        'max_missing': int(dev.signals_max_missing.data()),
+        'gap_fill': str(dev.signals_gap_fill.data()),
+        'derived': list(derived or []),
+        'raw': None if raw is None else str(raw.fullpath),
+        'compress': bool(compress),
+        'debug': dev.debugging(),
+    }
+
+class Storage(object):
+    """
+    The writer side of an acquisition, run in its own process by
+    writer() on a SharedRing it attached to.
+    """
+
+    def __init__(self, settings, ring, record_latency=False):
+        self.settings = settings
+        self.ring = ring
+        self.record_latency = record_latency
+        params = settings['params']
+        selectors = settings['selectors']
+        self.tree = MDSplus.Tree(settings['tree'], settings['shot'])
+        self.signal = self.tree.getNode(settings['signal'])
+        self.raw = settings['raw'] is not None
+        self.node = self.tree.getNode(settings['raw']) if self.raw else self.signal
+        if settings['compress']:
+            self.node.compress_segments = True
+        self.decoder = mpcs_contract.decoder(settings['name'], params['RAW_SHAPE'], params['RAW_TYPE'])
+        self.rate = float(params['RATE'])
+        self.phase = float(params['PHASE'])
+        self.phys_type = mpcs_contract.raw_dtype(params['PHYS_TYPE'])
+        self.hal = hal_kernel(params, self.tree.getNode(settings['hal']), selectors, settings['debug'])
+        self.selector = selector(params, selectors)
+        self.gaps = gap_detector(settings['max_missing'], settings['gap_fill'], params, self.raw)
+        if self.raw:
+            self.scale, self.offset = raw_storage(params, self.hal, selectors, settings['gap_fill'])
+            shape = mpcs_contract.shape_of(params['RAW_SHAPE'] if selectors is None else len(selectors))
+            dtype = mpcs_contract.raw_dtype(params['RAW_TYPE'])
+        else:
+            shape, dtype = mpcs_contract.shape_of(params['PHYS_SHAPE']), self.phys_type
+        self.writer = self.segment_writer(self.node, shape, dtype)
+        self.derived = settings['derived']
+        for derived in self.derived:
+            derived.configure(self.rate, self.phase)
+        self.derived_writers = {}
+        self.samples = 0
+        self.start_delay = None
+        self.packets = 0
+        self.peak_occupancy = 0
+        self.occupancy = []
+        self.recv_hist = mpcs_diagnostics.LogHistogram()
+        self.store_hist = mpcs_diagnostics.LogHistogram()
+        self.latency = []
+
+    def run(self):
+        """ store from START to STOP, False if stopped before START """
+        while not (self.ring.running or self.ring.stopping):
+            time.sleep(FIRST_PERIOD)
+        if not self.ring.running:
+            return False
+        while not self.ring.stopping:
+            time.sleep(PERIOD if self.samples else FIRST_PERIOD)
+            self.drain()
+        self.drain()
+        for derived in self.derived:
+            self.put_derived(derived, *derived.finish())
+        for writer in [self.writer] + list(self.derived_writers.values()):
+            writer.close()
+        if self.raw and self.samples:
+            self.signal.record = mpcs_hal.read_expression(self.node, self.scale, self.offset)
+        if self.gaps.counts:
+            starts = np.array(self.gaps.starts) / self.rate + self.phase
+            self.tree.getNode(self.settings['gaps']).record = MDSplus.Signal(np.array(self.gaps.counts, dtype=np.int32),
+                                                                             None, starts)
+        mpcs_diagnostics.store(self.tree, self.settings['head'], self)
+        return True
+
+    def drain(self):
+        ring = self.ring
+        waiting = min(ring.occupancy(), ring.slots)
+        self.peak_occupancy = max(self.peak_occupancy, waiting)
+        self.occupancy.append((time.time(), waiting))
+        data, sizes, times = ring.read()
+        if len(data) == 0:
+            return
+        drained = time.time()
+        keep, seq, raw = self.decoder.decode(data, sizes)
+        if len(seq) == 0:
+            return
+        arrived = times[keep]
+        self.packets += len(seq)
+        self.recv_hist.add(drained - arrived)
+        if self.selector is not None:
+            raw = raw[:, self.selector]
+        if not self.raw:
+            raw = self.hal(raw).astype(self.phys_type, copy=False)
+        seq, block = self.gaps.check(seq, raw)
+        self.writer.put(seq, block)
+        if self.start_delay is None and len(seq):
+            self.start_delay = time.time() - self.ring.started * 1e-9
+        if self.derived and len(seq):
+            self.derive(seq, self.hal(block).astype(self.phys_type, copy=False) if self.raw else block)
+        self.samples += len(seq)
+        self.store_hist.add(time.time() - drained, len(arrived))
+        if self.record_latency:
+            self.latency.append(time.time() - arrived)
+
+    def segment_writer(self, node, shape, dtype, factor=1):
+        return mpcs_segments.SegmentWriter(node, self.rate / factor, self.phase, self.settings['seg_length'],
+                                           shape, dtype)
+
+    def derive(self, seq, phys):
+        for derived in self.derived:
+            self.put_derived(derived, *derived.apply(seq, phys))
+
+    def put_derived(self, derived, seq, blocks):
+        if len(seq) == 0:
+            return
+        for path, block in zip(derived.paths, blocks):
+            if path not in self.derived_writers:
+                self.derived_writers[path] = self.segment_writer(self.tree.getNode(path), block.shape[1:], block.dtype,
+                                                                   derived.factor)
+            self.derived_writers[path].put(seq, block)
+
+    def summary(self):
+        return {
+            'samples': self.samples,
+            'packets': self.packets,
+            'late': self.gaps.late,
+            'missing': self.gaps.missing,
+            'segments': self.writer.segments,
+            'start_delay': self.start_delay,
+            'peak_occupancy': self.peak_occupancy,
+            'latency': self.latency,
+            'fault': self.gaps.fault,
+        }
+
+def writer(settings, ring_name, slots, slot_size, record_latency, conn):
+    """
+    Writer process: attach to the ring, set up the Storage and say so,
+    store from when the ring is set running until it is set stopping
+    and send back a summary of the shot.
+    """
+    ring = mpcs_receiver.SharedRing(slots, slot_size, ring_name)
+    try:
+        try:
+            storage = Storage(settings, ring, record_latency)
+        except Exception as e:
+            conn.send({'error': e})
+            return
+        conn.send({'ready': True})
+        summary = {}
+        try:
+            storage.run()
+        except Exception as e:
+            summary['error'] = e
+        summary.update(storage.summary())
+        conn.send(summary)
+    finally:
+        conn.close()
+        ring.close()
+
+def writer_context():
+    """
+    The multiprocessing context writers start in.  A spawned writer
+    runs PYTHON, or if that is not set sys.executable when it is a
+    Python interpreter, else the python3 on the PATH.
+    """
+    context = multiprocessing.get_context(CONTEXT)
+    if CONTEXT != 'fork':
+        executable = PYTHON
+        if not executable and not os.path.basename(sys.executable or '').lower().startswith('python'):
+            executable = shutil.which('python3')
+            if executable is None:
+                raise RuntimeError('%s is not a Python interpreter, set MPCS_PYTHON to one for the writer processes'
+                                   % (sys.executable,))
+        if executable:
+            context.set_executable(executable)
+    return context
+
+class Acquisition(object):
+    """
+    The receiver side of an acquisition: the subscription whose ring
+    the writer process drains.
+    """
+
+    record_latency = False
+
+    def __init__(self, dev, signal, hal, selectors=None, derived=None, raw=None, compress=False):
+        self.path = str(signal.fullpath)
+        self.debug = dev.debugging()
+        self.settings = settings(dev, signal, hal, selectors, derived, raw, compress)
+        params = self.settings['params']
+        self.decoder = decoder(dev, params, selectors)
+        self.receiver = mpcs_receiver.subscribe(dev.comms_address.data(), dev.comms_port.data(),
+                                                self.decoder.name, self.decoder.slot_size,
+                                                max(int(float(params['RATE']) * RING_SECONDS), 16), shared=True)
+        self.summary = {}
+        self.received = 0
+        self.lost = 0
+        self.samples = 0
+        self.packets = 0
+        self.late = 0
+        self.missing = 0
+        self.segments = 0
+        self.start_delay = None
+        self.latency = []
+        self.started = False
+        context = writer_context()
+        self.conn, self.child = context.Pipe(duplex=False)
+        ring = self.receiver.ring
+        self.process = context.Process(target=writer, name='MPCS %s' % (dev.path,),
+                                       args=(self.settings, ring.name, ring.slots, ring.slot_size,
+                                             self.record_latency, self.child))
+        self.process.daemon = True
+
+    def arm(self):
+        """ start the writer process and the subscription, and wait until both are ready """
+        self.process.start()
+        self.child.close()
+        try:
+            ready = self.conn.recv()
+        except EOFError:
+            ready = {'error': RuntimeError('%s: writer process exited' % (self.path,))}
+        if 'error' in ready:
+            self.process.join()
+            self.receiver.ring.close()
+            raise ready['error']
+        self.receiver.start()
+
+    def start(self):
+        ring = self.receiver.ring
+        ring.started = time.time_ns()
+        ring.running = 1
+        self.started = True
+
+    def finish(self):
+        ring = self.receiver.ring
+        self.receiver.stop()
+        ring.stopping = 1
+        try:
+            self.summary = self.conn.recv()
+        except EOFError:
+            pass
+        self.process.join()
+        self.received, self.lost = ring.head, ring.lost
+        ring.close()
+        for name in ('samples', 'packets', 'late', 'missing', 'segments', 'start_delay', 'latency'):
+            setattr(self, name, self.summary.get(name, getattr(self, name)))
+        if self.debug:
+            print("%s: %d messages, %d lost, %d late, %d missing, %d samples stored in %d segments" %
+                  (self.path, self.received, self.lost, self.late, self.missing, self.samples, self.segments))
+            if self.start_delay is not None:
+                print("%s: first sample stored %.6f s after START" % (self.path, self.start_delay))
+        if 'error' in self.summary:
+            raise self.summary['error']
+        if self.process.exitcode:
+            raise RuntimeError('%s: writer process exited with %d' % (self.path, self.process.exitcode))
+        if self.summary.get('fault') is not None:
+            raise self.summary['fault']
+
+def configure(dev, signal, hal, selectors=None, derived=None, raw=None, compress=False):
+    """ check the contract and arm its acquisition """
+    if key(dev) in _active:
+        raise Exception('%s: already configured' % (dev.path,))
+    params = mpcs_parameters.load(dev)
+    decoder(dev, params, selectors)
+    selector(params, selectors)
+    kernel = hal_kernel(params, hal, selectors, dev.debugging())
+    gap_detector(dev.signals_max_missing.data(), dev.signals_gap_fill.data(), params, raw is not None)
+    if raw is not None:
+        raw_storage(params, kernel, selectors, dev.signals_gap_fill.data())
+    acq = Acquisition(dev, signal, hal, selectors, derived, raw, compress)
+    acq.arm()
+    _active[key(dev)] = acq
+    if dev.debugging():
+        print("%s: configured for %s:%d" % (dev.path, dev.comms_address.data(), dev.comms_port.data()))
+
+def active(dev):
+    """ the armed or running Acquisition of dev, or None """
+    return _active.get(key(dev))
+
+def armed(dev):
+    acq = active(dev)
+    return acq is not None and not acq.started
+
+def start(dev):
+    acq = active(dev)
+    if acq is None:
+        raise Exception('%s: not configured' % (dev.path,))
+    if acq.started:
+        raise Exception('%s: already started' % (dev.path,))
+    acq.start()
+
+def stop(dev):
+    acq = active(dev)
+    if acq is None or not acq.started:
+        raise Exception('%s: not started' % (dev.path,))
+    del _active[key(dev)]
+    acq.finish()
+
+@atexit.register
+def disarm():
+    """ let the writers of acquisitions configured but never started exit """
+    for k, acq in list(_active.items()):
+        if not acq.started:
+            del _active[k]
+            try:
+                acq.finish()
+            except Exception:
+                pass
@@ -0,0 +1,237 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Wire format shared by the MPCS data contracts.
+
+    Every SDN message is a fixed size datagram:
+
+       name      COMMS:NAME, nul padded to NAME_LENGTH bytes
+       seq       little endian uint64, number of ticks of RATE
+                 since the epoch, so that the sample time is
+                 seq / RATE + PHASE
+       payload   RAW_SHAPE values of RAW_TYPE, little endian
+
+"""
+import hashlib
+
+import numpy as np
+
+NAME_LENGTH = 16
+SEQ_OFFSET = NAME_LENGTH
+HEADER_SIZE = NAME_LENGTH + 8
+MAX_PACKET = 65507
+
+RAW_TYPES = {
+    'byte': '<i1',
+    'short': '<i2',
+    'int': '<i4',
+    'long': '<i8',
+    'float': '<f4',
+    'double': '<f8',
+}
+
+def raw_dtype(raw_type):
+    """ numpy dtype for a RAW_TYPE / PHYS_TYPE string """
+    try:
+        return np.dtype(RAW_TYPES[str(raw_type).strip().lower()])
+    except KeyError:
+        raise ValueError('Unsupported data type "%s"' % (raw_type,))
+
+def shape_of(raw_shape):
+    """ RAW_SHAPE / PHYS_SHAPE node data as a shape tuple """
+    return tuple(int(n) for n in np.atleast_1d(raw_shape))
+
+def packet_size(raw_shape, raw_type):
+    return HEADER_SIZE + int(np.prod(shape_of(raw_shape))) * raw_dtype(raw_type).itemsize
+
+def pad_name(name):
+    """ name as sent on the wire """
+    return str(name).strip().encode('ascii')[:NAME_LENGTH].ljust(NAME_LENGTH, b'\0')
+
+def comms_name(dev):
+    """
+    The name sent with each message, COMMS:NAME or if that
+    is empty the name of the device head node.
+    """
+    try:
+        name = str(dev.getNode('.COMMS:NAME').data())
+    except Exception:
+        name = ''
+    return pad_name(name or dev.node_name)
+
+def message_dtype(raw_shape, raw_type, itemsize=None):
+    """ structured dtype of one message, optionally padded to itemsize """
+    shape = shape_of(raw_shape)
+    return np.dtype({'names': ['name', 'seq', 'payload'],
+                     'formats': ['S%d' % NAME_LENGTH, '<u8', (raw_dtype(raw_type), shape)],
+                     'offsets': [0, SEQ_OFFSET, HEADER_SIZE],
+                     'itemsize': itemsize or packet_size(shape, raw_type)})
+
+class Decoder(object):
+    """
+    Decodes a block of received messages, one per slot_size row,
+    with a single np.frombuffer.  The slot is one byte longer than
+    the message so a datagram that is too long shows in its size.
+    """
+
+    def __init__(self, name, raw_shape, raw_type):
+        self.name = name
+        self.shape = shape_of(raw_shape)
+        self.size = packet_size(self.shape, raw_type)
+        self.slot_size = self.size + 1
+        self.dtype = message_dtype(self.shape, raw_type, self.slot_size)
+
+    def decode(self, block, sizes):
+        """
+        Sequence numbers and payload of the messages in block for this
+        contract, and which rows they came from.
+        """
+        records = np.frombuffer(block, dtype=self.dtype)
+        keep = (sizes == self.size) & (records['name'] == self.name.rstrip(b'\0'))
+        if not keep.all():
+            records = records[keep]
+        return keep, records['seq'], records['payload']
+
+_decoders = {}
+
+def decoder(name, raw_shape, raw_type):
+    """ the Decoder for a contract, built once """
+    key = (name, shape_of(raw_shape), str(raw_type))
+    if key not in _decoders:
+        _decoders[key] = Decoder(name, raw_shape, raw_type)
+    return _decoders[key]
+
+def validate(params, selectors=None):
+    """
+    Reject a contract whose RAW_SHAPE, RAW_TYPE, PHYS_SHAPE and
+    PHYS_TYPE do not fit together.
+    """
+    raw_shape = shape_of(params['RAW_SHAPE'])
+    phys_shape = shape_of(params['PHYS_SHAPE'])
+    for label, shape in (('RAW_SHAPE', raw_shape), ('PHYS_SHAPE', phys_shape)):
+        if len(shape) == 0 or min(shape) <= 0:
+            raise ValueError('%s must be positive, not %s' % (label, shape))
+    raw_dtype(params['RAW_TYPE'])
+    raw_dtype(params['PHYS_TYPE'])
+    if selectors is not None:
+        selector(selectors, raw_shape, phys_shape)
+    elif phys_shape != raw_shape:
+        raise ValueError('PHYS_SHAPE %s does not match RAW_SHAPE %s' % (phys_shape, raw_shape))
+    if packet_size(raw_shape, params['RAW_TYPE']) > MAX_PACKET:
+        raise ValueError('RAW_SHAPE %s of %s does not fit in a datagram' % (raw_shape, params['RAW_TYPE']))
+
+def selector(selectors, raw_shape, phys_shape=None):
+    """
+    Index selecting SELECTORS from each sample of RAW_SHAPE.
+
+    Evenly spaced increasing selectors become a slice so that
+    block[:, selector] is a strided view of the received block,
+    anything else an index array.
+    """
+    raw_shape = shape_of(raw_shape)
+    index = np.atleast_1d(np.asarray(selectors))
+    if len(raw_shape) != 1:
+        raise ValueError('Selectors need a one dimensional RAW_SHAPE, not %s' % (raw_shape,))
+    if index.ndim != 1 or len(index) == 0 or index.dtype.kind not in 'iu':
+        raise ValueError('Selectors must be a list of channel numbers')
+    if index.min() < 0 or index.max() >= raw_shape[0]:
+        raise ValueError('Selectors %s out of range for RAW_SHAPE %s' % (index.tolist(), raw_shape))
+    if phys_shape is not None and shape_of(phys_shape) != (len(index),):
+        raise ValueError('PHYS_SHAPE %s does not match %d selectors' % (shape_of(phys_shape), len(index)))
+    step = index[1] - index[0] if len(index) > 1 else 1
+    if step > 0 and np.array_equal(index, index[0] + step * np.arange(len(index))):
+        return slice(int(index[0]), int(index[-1]) + 1, int(step))
+    return index.astype(np.intp)
+
+def immutable_paths(parts):
+    """ paths of the .PARAMETERS.IMMUTTABLE value nodes in a device's parts """
+    return [part['path'] for part in parts
+            if part['path'].upper().startswith('.PARAMETERS.IMMUTTABLE')
+            and str(part.get('type', '')).lower() != 'structure']
+
+def fingerprint(guid, values):
+    """
+    sha256 hex digest of the contract GUID followed by each
+    (path, value) in order, values hashed as their dtype, shape
+    and bytes.  PCS computes the same digest from its side of the
+    contract.
+    """
+    digest = hashlib.sha256(str(guid).encode('ascii'))
+    for path, value in values:
+        value = np.asarray(value)
+        if value.dtype.kind == 'U':
+            value = np.char.encode(np.char.rstrip(value), 'ascii')
+        digest.update(path.upper().encode('ascii'))
+        digest.update(value.dtype.str.encode('ascii'))
+        digest.update(str(value.shape).encode('ascii'))
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+def contract_fingerprint(head, parts):
+    """ fingerprint of a device's GUID and immutable parameters as stored """
+    return fingerprint(head.getNode(':GUID').data(),
+                       [(path, head.getNode(path).data()) for path in immutable_paths(parts)])
+
+def stored_fingerprint(dev):
+    import MDSplus
+    try:
+        stored = str(dev.fingerprint.data()).strip()
+    except MDSplus.MdsException:
+        stored = ''
+    if not stored:
+        raise ValueError('%s: no contract FINGERPRINT stored' % (dev.path,))
+    return stored
+
+def check(dev, expected=None):
+    """
+    Compare the FINGERPRINT stored at Add() with the one from PCS,
+    expected or if that is not given PCS_PRINT.  Only those two nodes
+    are read; there must be something to compare against.
+    """
+    import MDSplus
+    stored = stored_fingerprint(dev)
+    if expected is None:
+        try:
+            expected = dev.getNode(':PCS_PRINT').data()
+        except MDSplus.MdsException:
+            raise ValueError('%s: no fingerprint from PCS to check against, PCS_PRINT is empty' % (dev.path,))
+    if stored != str(expected).strip():
+        raise ValueError('%s: contract fingerprint %s does not match PCS %s' % (dev.path, stored, expected))
+    if dev.debugging():
+        print("%s: contract fingerprint %s matches PCS" % (dev.path, stored))
+
+def verify(dev, parts):
+    """
+    Recompute the fingerprint from the GUID and every immutable
+    parameter node and compare it with the stored FINGERPRINT; this
+    reads each node, so it is not part of CHECK.
+    """
+    stored = stored_fingerprint(dev)
+    computed = contract_fingerprint(dev, parts)
+    if computed != stored:
+        raise ValueError('%s: immutable parameters give fingerprint %s, not the stored %s' % (dev.path, computed, stored))
+    if dev.debugging():
+        print("%s: immutable parameters match fingerprint %s" % (dev.path, stored))
@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Signals derived from an MPCS contract while it is acquired.
+
+    A Derived transform turns each block the writer stores into blocks
+    for one or more other signal nodes, which the writer segments on
+    the RATE / PHASE grid decimated by the transform's factor.
+    Transforms are built when the device is armed at CONFIG and
+    pickled once to the writer process with the rest of its settings
+    as it is started, so they are configured and run only in the
+    writer, carrying whatever state they need from one block to the
+    next.  At STOP finish() returns anything they still hold.
+
+    Plane fits a tilted plane to the surface seen by the TOF sensors,
+    each mounted at Z[i] and measuring the height of the surface above
+    itself:
+
+        Z[i] + height[i] = z + tilt_x * R[i] cos(PHI[i]) + tilt_y * R[i] sin(PHI[i])
+
+    plane_pinv(R, PHI) is the least squares pseudoinverse of that
+    geometry, computed once at CONFIG, and Plane adds PINV . Z to every
+    fit, so that each block is a single matrix multiply and z is in the
+    frame of Z whether or not the sensors are coplanar.
+
+    Integrator integrates a rate signal block by block with cumsum,
+    carrying the running integral from one block to the next.  The
+    first BASELINE seconds after START, before the shot, give the drift
+    offset of each channel; the integral is zero until then and starts
+    from that point with the offset subtracted.  Filled holes in the
+    block (nan) add nothing.
+
+    Decimate keeps the min, max and mean of each FACTOR samples, aligned
+    on the sequence so that every window covers the same samples no
+    matter how the blocks arrive, in the signal's MIN_<FACTOR>,
+    MAX_<FACTOR> and MEAN_<FACTOR> nodes; pyramid() gives one for each
+    of LEVELS.  read() picks the coarsest level that still has a sample
+    for each pixel of a plot, so browsing a long record at 10 kHz only
+    reads what can be seen.
+
+"""
+import numpy as np
+
+LEVELS = (10, 100, 1000)
+STATS = ('MIN', 'MAX', 'MEAN')
+
+class Derived(object):
+
+    factor = 1
+
+    def __init__(self, nodes):
+        self.paths = [str(node.fullpath) for node in nodes]
+
+    def configure(self, rate, phase):
+        self.rate = float(rate)
+        self.phase = float(phase)
+
+    def apply(self, seq, block):
+        """
+        (seq, blocks) from block, samples seq of the contract: a block
+        for each of paths, with seq numbering its rows at RATE / factor.
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        return np.zeros(0, dtype=np.uint64), []
+
+def plane_pinv(r, phi):
+    """ (3, sensors) matrix from sensor heights to z, tilt_x and tilt_y """
+    r = np.asarray(r, dtype=np.float64)
+    phi = np.radians(np.asarray(phi, dtype=np.float64))
+    if r.shape != phi.shape or r.ndim != 1:
+        raise ValueError('R and PHI must be vectors of the same length')
+    geometry = np.column_stack((np.ones_like(r), r * np.cos(phi), r * np.sin(phi)))
+    if np.linalg.matrix_rank(geometry) < 3:
+        raise ValueError('Sensors at R %s PHI %s do not determine a plane' % (r.tolist(), np.degrees(phi).tolist()))
+    return np.linalg.pinv(geometry)
+
+class Plane(Derived):
+    """ bagel z, tilt_x and tilt_y from the sensor heights above Z """
+
+    def __init__(self, pinv, nodes, z=None):
+        super(Plane, self).__init__(nodes)
+        self.pinv = np.asarray(pinv, dtype=np.float64)
+        if len(self.paths) != self.pinv.shape[0]:
+            raise ValueError('%d signals for %d plane parameters' % (len(self.paths), self.pinv.shape[0]))
+        if z is None:
+            z = np.zeros(self.pinv.shape[1])
+        z = np.asarray(z, dtype=np.float64)
+        if z.shape != (self.pinv.shape[1],):
+            raise ValueError('Z %s for %d sensors' % (z.tolist(), self.pinv.shape[1]))
+        self.offset = np.dot(self.pinv, z)
+
+    def apply(self, seq, block):
+        fit = np.dot(block, self.pinv.T.astype(block.dtype, copy=False))
+        fit += self.offset.astype(fit.dtype, copy=False)
+        return seq, [fit[:, i] for i in range(fit.shape[1])]
+
+class Integrator(Derived):
+    """ running time integral of each channel, drift corrected """
+
+    def __init__(self, baseline, nodes):
+        super(Integrator, self).__init__(nodes)
+        self.baseline = float(baseline)
+        if self.baseline < 0:
+            raise ValueError('Baseline of %g s must not be negative' % (self.baseline,))
+        self.end = None
+        self.sum = 0.
+        self.count = 0
+        self.offset = None
+        self.total = None
+
+    def apply(self, seq, block):
+        block = block.astype(np.float64)
+        if self.end is None:
+            self.end = int(seq[0]) + int(round(self.baseline * self.rate))
+        out = np.zeros_like(block)
+        after = np.searchsorted(seq, self.end)
+        if self.offset is None:
+            before = block[:after]
+            self.sum = self.sum + np.nansum(before, axis=0)
+            self.count = self.count + np.sum(~np.isnan(before), axis=0)
+            if after == len(seq):
+                return seq, [out]
+            self.offset = self.sum / np.maximum(self.count, 1)
+            self.total = np.zeros(block.shape[1:])
+        rates = block[after:] - self.offset
+        rates[np.isnan(rates)] = 0.
+        out[after:] = self.total + np.cumsum(rates, axis=0) / self.rate
+        self.total = out[-1]
+        return seq, [out]
+
+class Decimate(Derived):
+    """ min, max and mean of each factor samples of a signal """
+
+    def __init__(self, signal, factor):
+        self.factor = int(factor)
+        self.paths = ['%s:%s_%d' % (signal.fullpath, stat, self.factor) for stat in STATS]
+        self.seq = None
+        self.block = None
+
+    def apply(self, seq, block):
+        if self.seq is not None:
+            seq = np.concatenate((self.seq, seq))
+            block = np.concatenate((self.block, block))
+        window = seq // self.factor
+        if (int(seq[-1]) + 1) % self.factor == 0:
+            done = len(seq)
+        else:
+            done = np.searchsorted(window, window[-1])
+        self.seq, self.block = seq[done:], block[done:]
+        return self.reduce(window[:done], block[:done])
+
+    def finish(self):
+        if self.seq is None or len(self.seq) == 0:
+            return super(Decimate, self).finish()
+        seq, block = self.seq, self.block
+        self.seq = self.block = None
+        return self.reduce(seq // self.factor, block)
+
+    def reduce(self, window, block):
+        if len(window) == 0:
+            return window, [block[:0]] * 3
+        starts = np.flatnonzero(np.r_[True, window[1:] != window[:-1]])
+        valid = ~np.isnan(block) if block.dtype.kind == 'f' else np.ones(block.shape, dtype=bool)
+        sums = np.add.reduceat(np.where(valid, block, 0), starts, axis=0, dtype=np.float64)
+        counts = np.add.reduceat(valid, starts, axis=0, dtype=np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums / counts
+        if block.dtype.kind == 'f':
+            mean = mean.astype(block.dtype)
+        return window[starts], [np.fmin.reduceat(block, starts, axis=0),
+                                np.fmax.reduceat(block, starts, axis=0), mean]
+
+def pyramid(signal, levels=LEVELS):
+    """ a Decimate for each of levels """
+    return [Decimate(signal, factor) for factor in levels]
+
+def pyramid_parts(path, levels=LEVELS):
+    """ device parts for the pyramid nodes of the signal at path """
+    return [{'path': '%s:%s_%d' % (path, stat, factor),
+             'type': 'signal',
+             'options': ('no_write_model', 'write_once',),
+             'help': '%s of each %d samples of %s' % (stat.capitalize(), factor, path.split(':')[-1])}
+            for factor in levels for stat in STATS]
+
+def level(rate, begin, end, pixels, levels=LEVELS):
+    """ the coarsest factor with at least pixels samples from begin to end, 1 for none """
+    samples = (float(end) - float(begin)) * float(rate)
+    fits = [factor for factor in levels if samples / factor >= pixels]
+    return max(fits) if fits else 1
+
+def read(signal, rate, begin, end, pixels, levels=LEVELS):
+    """
+    Times, min, max and mean of signal from begin to end at the level
+    chosen by level(), from the signal itself if no level is coarse
+    enough.
+    """
+    factor = level(rate, begin, end, pixels, levels)
+    tree = signal.tree
+    tree.setTimeContext(begin, end, None)
+    try:
+        if factor == 1:
+            record = signal.record
+            data = record.data()
+            return record.dim_of().data(), data, data, data
+        records = [tree.getNode('%s:%s_%d' % (signal.fullpath, stat, factor)).record for stat in STATS]
+        return (records[0].dim_of().data(),) + tuple(record.data() for record in records)
+    finally:
+        tree.setTimeContext()
@@ -0,0 +1,139 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Per shot diagnostics of MPCS acquisition.
+
+    LogHistogram keeps a compact histogram of latencies in buckets of
+    equal width in log10, PER_DECADE to a decade from LOW to HIGH seconds,
+    with the first and last buckets also counting anything below or
+    above the range.  store() writes the counters, ring occupancy, START
+    to first sample delay and histograms of an acquisition's Storage
+    into the device's .DIAGNOSTICS subtree at STOP.
+
+    parts() gives the device parts every MPCS device shares for this:
+    SIGNALS:GAP_FILL, GAPS and SEG_LENGTH, and the .DIAGNOSTICS nodes.
+
+"""
+import MDSplus
+import numpy as np
+
+LOW = 1e-6
+HIGH = 10.
+PER_DECADE = 4
+
+class LogHistogram(object):
+
+    def __init__(self, low=LOW, high=HIGH, per_decade=PER_DECADE):
+        self.low = float(low)
+        self.per_decade = int(per_decade)
+        self.buckets = int(round(np.log10(high / low) * self.per_decade))
+        self.counts = np.zeros(self.buckets, dtype=np.int64)
+
+    def edges(self):
+        """ lower edge of each bucket in seconds """
+        return self.low * 10. ** (np.arange(self.buckets) / float(self.per_decade))
+
+    def add(self, values, count=1):
+        """ count values, or count times the scalar value """
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        index = np.floor(np.log10(np.maximum(values, self.low) / self.low) * self.per_decade)
+        index = np.clip(index, 0, self.buckets - 1).astype(np.intp)
+        if len(index) == 1:
+            self.counts[index[0]] += count
+        else:
+            self.counts += np.bincount(index, minlength=self.buckets)
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        """ lower edge of the bucket holding the q'th percentile """
+        total = self.total()
+        if total == 0:
+            return 0.
+        return float(self.edges()[np.searchsorted(np.cumsum(self.counts), total * q / 100.)])
+
+    def signal(self):
+        return MDSplus.Signal(self.counts, None, self.edges())
+
+def occupancy(samples):
+    """ (time, messages waiting) samples as a signal of occupancy vs time """
+    samples = np.array(samples, dtype=np.float64).reshape(-1, 2)
+    return MDSplus.Signal(samples[:, 1].astype(np.int32), None, samples[:, 0])
+
+DIAGNOSTICS = (
+    (':PACKETS', 'numeric', 'Messages received for this contract'),
+    (':LOST', 'numeric', 'Messages overwritten in the ring before they were stored'),
+    (':LATE', 'numeric', 'Messages that arrived after later samples were stored'),
+    (':MISSING', 'numeric', 'Samples missing from the sequence'),
+    (':PEAK_OCCUP', 'numeric', 'Most messages waiting in the receive ring'),
+    (':OCCUPANCY', 'signal', 'Messages waiting in the receive ring each time the writer drained it'),
+    (':START_DELAY', 'numeric', 'Seconds from START to the first sample stored'),
+    (':RECV_HIST', 'signal', 'Counts of arrival to writer process latency, by lower bucket edge in s'),
+    (':STORE_HIST', 'signal', 'Counts of storage thread to segment written latency, by lower bucket edge in s'),
+)
+
+def parts(seg_length):
+    """ device parts for gap filling, segmenting and .DIAGNOSTICS, SEG_LENGTH defaulting to seg_length """
+    return [{'path': '.SIGNALS:GAP_FILL',
+             'type': 'text',
+             'value': 'nan',
+             'options': ('no_write_shot',),
+             'help': 'Fill missing samples with nan or hold the last sample'},
+            {'path': '.SIGNALS:GAPS',
+             'type': 'signal',
+             'options': ('no_write_model', 'write_once',),
+             'help': 'Number of samples missing in each gap'},
+            {'path': '.SIGNALS:SEG_LENGTH',
+             'type': 'numeric',
+             'value': seg_length,
+             'options': ('no_write_shot',),
+             'help': 'Number of samples in each stored segment'},
+            {'path': '.DIAGNOSTICS',
+             'type': 'structure',
+             'help': 'How close the last shot came to the limits of the contract'},
+            ] + [{'path': '.DIAGNOSTICS' + path,
+                  'type': kind,
+                  'options': ('no_write_model', 'write_once',),
+                  'help': text}
+                 for path, kind, text in DIAGNOSTICS]
+
+def store(tree, head_path, storage):
+    """ fill head_path.DIAGNOSTICS from a finished Storage """
+    values = {
+        ':PACKETS': storage.packets,
+        ':LOST': storage.ring.lost,
+        ':LATE': storage.gaps.late,
+        ':MISSING': storage.gaps.missing,
+        ':PEAK_OCCUP': storage.peak_occupancy,
+        ':OCCUPANCY': occupancy(storage.occupancy),
+        ':RECV_HIST': storage.recv_hist.signal(),
+        ':STORE_HIST': storage.store_hist.signal(),
+    }
+    if storage.start_delay is not None:
+        values[':START_DELAY'] = storage.start_delay
+    for path, value in values.items():
+        tree.getNode(head_path + '.DIAGNOSTICS' + path).record = value
@@ -0,0 +1,163 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Run the setup methods of every MPCS device in a tree concurrently.
+
+    The dispatcher runs the CHECK and CONFIG actions one after another.
+    run() finds every LIFT_COIL, PICKUP_COILS and TOF_SENSORS instance
+    and runs the methods of different devices on a bounded thread pool,
+    each worker with its own tree context, so setup time follows the
+    slowest device rather than the number of devices.
+
+    Arming an acquisition (the device's arm()) starts its writer
+    process and subscription in the process that runs it, so it has to
+    happen in the action server that will then run START and STOP.
+    Each device's CONFIG action calls config(), which arms every device
+    of the tree whose CONF_ACTION goes to the same server and is not
+    armed yet, all at once with run().  So the first CONFIG of a shot
+    arms them all concurrently, and the rest find theirs armed already.
+
+    From the command line, which exits when it is done, only
+    CLI_METHODS run unless others are named.
+
+        python mpcs_dispatch.py TREE SHOT [METHOD ...]
+
+"""
+import concurrent.futures
+import sys
+import threading
+import time
+
+import MDSplus
+
+import lift_coil
+import mpcs_acquisition
+import pickup_coils
+import tof_sensors
+
+MODELS = {
+    'LIFT_COIL': lift_coil.LIFT_COIL,
+    'PICKUP_COILS': pickup_coils.PICKUP_COILS,
+    'TOF_SENSORS': tof_sensors.TOF_SENSORS,
+}
+METHODS = ('CHECK', 'arm')
+CLI_METHODS = ('CHECK',)
+WORKERS = 8
+
+_arming = threading.Lock()
+
+def model_of(node):
+    try:
+        return str(node.record.model).strip().upper()
+    except MDSplus.MdsException:
+        return None
+
+def find_devices(tree):
+    """ (path, model) of every MPCS device head in tree """
+    found = []
+    for node in tree.getNodeWild('***', 'DEVICE'):
+        model = model_of(node)
+        if model in MODELS:
+            found.append((str(node.fullpath), model))
+    return found
+
+def run_device(tree_name, shot, path, model, methods):
+    """ run methods on one device, returning the seconds each took """
+    tree = MDSplus.Tree(tree_name, shot)
+    dev = MODELS[model](tree.getNode(path))
+    times = []
+    for method in methods:
+        start = time.time()
+        getattr(dev, method)()
+        times.append((method, time.time() - start))
+    return times
+
+def server_of(head):
+    """ the server a device's CONF_ACTION is dispatched to, or None """
+    try:
+        return str(head.getNode(':CONF_ACTION').record.dispatch.ident).strip()
+    except (MDSplus.MdsException, AttributeError):
+        return None
+
+def run(tree_name, shot, methods=METHODS, workers=WORKERS, devices=None):
+    """
+    Run methods on every MPCS device in the tree, or only on devices,
+    a list of (path, model), at most workers devices at a time.
+    Returns a list of (path, model, times, error) with times a list of
+    (method, seconds).
+    """
+    if devices is None:
+        devices = find_devices(MDSplus.Tree(tree_name, shot, 'ReadOnly'))
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(path, model, pool.submit(run_device, tree_name, shot, path, model, methods))
+                   for path, model in devices]
+        for path, model, future in futures:
+            try:
+                results.append((path, model, future.result(), None))
+            except Exception as e:
+                results.append((path, model, [], e))
+    return results
+
+def config(dev):
+    """
+    CONFIG of dev: arm, concurrently, every device of its tree that is
+    dispatched to the same server and not armed yet, then raise if dev
+    itself failed.
+    """
+    with _arming:
+        if mpcs_acquisition.armed(dev):
+            return
+        tree = dev.tree
+        server = server_of(dev)
+        devices = [(path, model) for path, model in find_devices(tree)
+                   if server_of(tree.getNode(path)) == server
+                   and mpcs_acquisition.active(tree.getNode(path)) is None]
+        results = run(str(tree.tree), int(tree.shot), ('arm',), devices=devices)
+    for path, model, times, error in results:
+        if error is not None and dev.debugging():
+            print('%s: arming %s failed: %s' % (dev.path, path, error))
+    if not mpcs_acquisition.armed(dev):
+        errors = [error for path, model, times, error in results if path == str(dev.fullpath) and error is not None]
+        if errors:
+            raise errors[0]
+        dev.arm()
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__)
+        return 1
+    start = time.time()
+    results = run(argv[1], int(argv[2]), tuple(argv[3:]) or CLI_METHODS)
+    for path, model, times, error in results:
+        print('%-40s %-13s %s%s' % (path, model,
+                                    ' '.join('%s %.3fs' % (method, seconds) for method, seconds in times),
+                                    '' if error is None else ' FAILED %s' % (error,)))
+    print('%d devices in %.3fs' % (len(results), time.time() - start))
+    return 1 if any(error is not None for path, model, times, error in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
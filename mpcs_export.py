@@ -0,0 +1,179 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Columnar export of the MPCS device data of a shot.
+
+    export() walks every LIFT_COIL, PICKUP_COILS and TOF_SENSORS in a
+    shot and writes each of their signals with data, a segment at a
+    time, as two flat little endian files, the samples and their times
+    in float64, that np.memmap can open as they are.  metadata.json
+    next to them lists, for each device, its model, FINGERPRINT and
+    immutable parameters, and for each signal its files, dtype, sample
+    shape and length.
+
+    Shot opens an export lazily: signal() maps only the two files of
+    the signal asked for and, given a time range, returns views of just
+    those rows.
+
+        python mpcs_export.py TREE SHOT DIRECTORY
+
+"""
+import json
+import os
+import re
+import sys
+
+import MDSplus
+import numpy as np
+
+import mpcs_contract
+import mpcs_dispatch
+import mpcs_parameters
+
+METADATA = 'metadata.json'
+TIME_TYPE = '<f8'
+
+def relative(head, node):
+    """ path of node below the device head, e.g. SIGNALS:FLUX """
+    head_path, path = str(head.fullpath), str(node.fullpath)
+    return path[len(head_path):].lstrip('.:') if path.upper().startswith(head_path.upper()) else path
+
+def device_key(head):
+    """ the head's path without its tree, e.g. TOP:PICKUP """
+    return re.sub(r'^\\\w+::', '', str(head.fullpath))
+
+def filename(*names):
+    return '.'.join(re.sub(r'[^\w]+', '_', name).strip('_') for name in names)
+
+def jsonable(value):
+    value = mpcs_parameters.value(value)
+    return value if isinstance(value, str) else value.tolist()
+
+def chunks(node):
+    """ (times, data) of node, a segment at a time if it is segmented """
+    segments = node.getNumSegments()
+    if segments:
+        for i in range(segments):
+            segment = node.getSegment(i)
+            yield segment.dim_of().data(), segment.data()
+    elif node.length:
+        record = node.record
+        yield record.dim_of().data(), record.data()
+
+def export_signal(node, directory, name):
+    """ write node as name.data and name.time, returning its metadata or None if empty """
+    meta = None
+    with open(os.path.join(directory, name + '.data'), 'wb') as data_file, \
+         open(os.path.join(directory, name + '.time'), 'wb') as time_file:
+        for times, data in chunks(node):
+            data = np.asarray(data)
+            times = np.asarray(times, dtype=TIME_TYPE)
+            if meta is None:
+                meta = {'data': name + '.data', 'time': name + '.time',
+                        'dtype': data.dtype.newbyteorder('<').str, 'shape': list(data.shape[1:]), 'length': 0}
+            data_file.write(np.ascontiguousarray(data, dtype=meta['dtype']).tobytes())
+            time_file.write(np.ascontiguousarray(times[:len(data)]).tobytes())
+            meta['length'] += len(data)
+    if meta is None:
+        os.remove(os.path.join(directory, name + '.data'))
+        os.remove(os.path.join(directory, name + '.time'))
+    return meta
+
+def export_device(head, model, directory):
+    head_path = str(head.fullpath)
+    params = mpcs_parameters.load(head)
+    immutable = [mpcs_parameters.key(head_path, path) for path in mpcs_contract.immutable_paths(mpcs_dispatch.MODELS[model].parts)]
+    meta = {
+        'model': model,
+        'fingerprint': str(head.getNode(':FINGERPRINT').data()),
+        'parameters': dict((name, jsonable(params[name])) for name in immutable if name in params),
+        'signals': {},
+    }
+    key = device_key(head)
+    for node in head.tree.getNodeWild(head_path + '***', 'SIGNAL'):
+        name = relative(head, node)
+        signal = export_signal(node, directory, filename(key, name))
+        if signal is not None:
+            meta['signals'][name] = signal
+    return key, meta
+
+def export(tree, shot, directory):
+    """ export every MPCS device of tree, shot into directory """
+    tree = MDSplus.Tree(tree, shot, 'ReadOnly')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    devices = {}
+    for path, model in mpcs_dispatch.find_devices(tree):
+        key, meta = export_device(tree.getNode(path), model, directory)
+        devices[key] = meta
+    metadata = {'tree': str(tree.tree), 'shot': int(tree.shot), 'devices': devices}
+    with open(os.path.join(directory, METADATA), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+class Shot(object):
+    """ lazy reader of an export """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, METADATA)) as f:
+            self.metadata = json.load(f)
+        self.devices = self.metadata['devices']
+
+    def parameters(self, device):
+        return self.devices[device]['parameters']
+
+    def signals(self, device):
+        return sorted(self.devices[device]['signals'])
+
+    def times(self, device, signal):
+        meta = self.devices[device]['signals'][signal]
+        return np.memmap(os.path.join(self.directory, meta['time']), dtype=TIME_TYPE, mode='r',
+                         shape=(meta['length'],))
+
+    def data(self, device, signal):
+        meta = self.devices[device]['signals'][signal]
+        return np.memmap(os.path.join(self.directory, meta['data']), dtype=meta['dtype'], mode='r',
+                         shape=(meta['length'],) + tuple(meta['shape']))
+
+    def signal(self, device, signal, begin=None, end=None):
+        """ (times, data) of a signal, mapped, from begin up to end if given """
+        times = self.times(device, signal)
+        first = 0 if begin is None else int(np.searchsorted(times, begin, 'left'))
+        last = len(times) if end is None else int(np.searchsorted(times, end, 'right'))
+        return times[first:last], self.data(device, signal)[first:last]
+
+def main(argv):
+    if len(argv) != 4:
+        print('usage: %s TREE SHOT DIRECTORY' % (argv[0],))
+        return 1
+    metadata = export(argv[1], int(argv[2]), argv[3])
+    for key, meta in sorted(metadata['devices'].items()):
+        print('%s: %s, %d signals' % (key, meta['model'], len(meta['signals'])))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
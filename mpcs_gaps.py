@@ -0,0 +1,123 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Missing sample detection for the MPCS data contracts.
+
+    Sequence numbers count ticks of RATE, so consecutive samples differ
+    by exactly one.  GapDetector.check works on a whole block at a time:
+    it puts the block in sequence order, drops repeated samples and
+    those older than the previous block, finds the holes in the sequence,
+    fills holes of up to MAX_MISSING samples with NaN or the last good
+    sample, and records every hole.  A hole longer than MAX_MISSING is
+    left as a break in the data.  Once more than MAX_MISSING samples
+    are missing in all, fault is set to a MissingSamplesError, which
+    the acquisition raises once everything has been stored.
+
+"""
+import numpy as np
+
+FILLS = ('nan', 'hold')
+
+class MissingSamplesError(Exception):
+    pass
+
+class GapDetector(object):
+
+    def __init__(self, max_missing, fill='nan', dtype=np.float64):
+        self.max_missing = int(max_missing)
+        self.fill = str(fill).strip().lower()
+        if self.fill not in FILLS:
+            raise ValueError('Gap fill must be one of %s, not "%s"' % (FILLS, fill))
+        if self.fill == 'nan' and np.dtype(dtype).kind not in 'fc':
+            raise ValueError('Can not fill %s samples with nan' % (np.dtype(dtype),))
+        self.last = None
+        self.held = None
+        self.missing = 0
+        self.late = 0
+        self.worst = 0
+        self.starts = []
+        self.counts = []
+        self.fault = None
+
+    def check(self, seq, block):
+        """
+        Return (seq, block) sorted, with late samples removed and short
+        holes filled, so seq only breaks where a hole exceeds max_missing.
+        """
+        if len(seq) == 0:
+            return seq, block
+        seq = seq.astype(np.int64)
+        if np.any(seq[1:] < seq[:-1]):
+            order = np.argsort(seq, kind='stable')
+            seq, block = seq[order], block[order]
+        last = seq[0] - 1 if self.last is None else self.last
+        keep = (seq > last) & (seq > np.r_[last, seq[:-1]])
+        if not keep.all():
+            self.late += int(len(keep) - keep.sum())
+            seq, block = seq[keep], block[keep]
+            if len(seq) == 0:
+                return seq, block
+        holes = np.diff(np.r_[last, seq]) - 1
+        where = np.flatnonzero(holes)
+        if len(where):
+            counts = holes[where]
+            self.starts.extend((seq[where] - counts).tolist())
+            self.counts.extend(counts.tolist())
+            self.missing += int(counts.sum())
+            self.worst = max(self.worst, int(counts.max()))
+            seq, block = self._fill(seq, block, holes)
+        self.last = int(seq[-1])
+        self.held = block[-1].copy()
+        if self.missing > self.max_missing and self.fault is None:
+            self.fault = MissingSamplesError('%d samples missing by seq %d, MAX_MISSING is %d' %
+                                             (self.missing, self.last, self.max_missing))
+        return seq, block
+
+    def _fill(self, seq, block, holes):
+        filled = np.where(holes <= self.max_missing, holes, 0)
+        if not filled.any():
+            return seq, block
+        rows = np.arange(len(seq)) + np.cumsum(filled)
+        total = len(seq) + int(filled.sum())
+        out = np.empty((total,) + block.shape[1:], dtype=block.dtype)
+        present = np.zeros(total, dtype=bool)
+        present[rows] = True
+        out[rows] = block
+        if self.fill == 'nan':
+            out[~present] = np.nan
+        else:
+            source = np.maximum.accumulate(np.where(present, np.arange(total), -1))
+            missing = ~present
+            if source[0] < 0:
+                head = source < 0
+                out[head] = block[0] if self.held is None else self.held
+                missing &= ~head
+            out[missing] = out[source[missing]]
+        position = np.arange(total)
+        following = np.minimum.accumulate(np.where(present, position, total)[::-1])[::-1]
+        grid = np.zeros(total, dtype=np.int64)
+        grid[rows] = seq
+        return grid[following] - (following - position), out
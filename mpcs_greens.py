@@ -0,0 +1,205 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Green's functions of the MPCS coils.
+
+    Every coil here is a set of coaxial circular loops, so the field
+    and flux of one ampere in it follow from the complete elliptic
+    integrals, ellipke() computes them for whole arrays at once by the
+    arithmetic-geometric mean.  They diverge on the filament itself,
+    so there they are clipped by MAX_M and MIN_DISTANCE.  A half loop
+    links half the flux of the full loop in the axisymmetric field
+    these tables describe.
+
+    table(dev) builds a Table for a LIFT_COIL or PICKUP_COILS device,
+    with for each of its coils Br, Bz and the mutual inductance to a
+    filament loop on a regular (r, z) GRID, then interpolates those
+    bilinearly for any number of points.  Tables are cached in memory
+    and as .npz files in CACHE (MPCS_GREENS_CACHE), keyed by the
+    device's contract FINGERPRINT and the grid, so the elliptic
+    integrals are evaluated once per contract.
+
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import mpcs_parameters
+
+MU0 = 4e-7 * np.pi
+GRID = ((0., .1, 101), (-.05, .15, 201))
+CACHE = os.environ.get('MPCS_GREENS_CACHE', os.path.join(tempfile.gettempdir(), 'mpcs_greens'))
+MAX_M = 1. - 1e-12
+MIN_DISTANCE = 1e-6
+
+def ellipke(m, tolerance=1e-15):
+    """ complete elliptic integrals K(m) and E(m), parameter m = k**2 < 1 """
+    m = np.asarray(m, dtype=np.float64)
+    a = np.ones_like(m)
+    b = np.sqrt(1. - m)
+    c = np.sqrt(m)
+    total = .5 * m
+    power = .5
+    while np.any(np.abs(c) > tolerance):
+        a, b, c = .5 * (a + b), np.sqrt(a * b), .5 * (a - b)
+        power *= 2.
+        total = total + power * c * c
+    k = np.pi / (2. * a)
+    return k, k * (1. - total)
+
+def _m(rc, zc, r, z):
+    m = 4. * rc * r / ((rc + r) ** 2 + (z - zc) ** 2)
+    return np.minimum(m, MAX_M)
+
+def mutual(rc, zc, r, z):
+    """ mutual inductance in H of coaxial loops of radius rc at zc and r at z """
+    m = _m(rc, zc, r, z)
+    k, e = ellipke(m)
+    root = np.sqrt(m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = MU0 * np.sqrt(rc * r) * ((2. / root - root) * k - 2. / root * e)
+    return np.where(m > 0, out, 0.)
+
+def field(rc, zc, r, z):
+    """ Br and Bz in T at (r, z) of one ampere in a loop of radius rc at zc """
+    dz = z - zc
+    m = _m(rc, zc, r, z)
+    k, e = ellipke(m)
+    outer = np.sqrt((rc + r) ** 2 + dz ** 2)
+    inner = np.maximum((rc - r) ** 2 + dz ** 2, MIN_DISTANCE ** 2)
+    bz = MU0 / (2. * np.pi * outer) * (k + (rc ** 2 - r ** 2 - dz ** 2) / inner * e)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        br = MU0 * dz / (2. * np.pi * r * outer) * (-k + (rc ** 2 + r ** 2 + dz ** 2) / inner * e)
+    return np.where(r > 0, br, 0.), bz
+
+def direction(value):
+    value = str(value).strip().lower()
+    if value not in ('up', 'down'):
+        raise ValueError('DIRECTION must be up or down, not "%s"' % (value,))
+    return 1. if value == 'up' else -1.
+
+def coils(params):
+    """
+    {name: (r, z, weight)} of the loops in each coil of a device, from
+    its parameters; weight is turns times sign, halved for a half loop.
+    """
+    if 'FULL_COIL:R' in params:
+        z = np.atleast_1d(params['FULL_COIL:Z']).astype(np.float64)
+        out = {'FULL_COIL': (np.broadcast_to(params['FULL_COIL:R'], z.shape).astype(np.float64), z,
+                             np.broadcast_to(params['FULL_COIL:TURNS'], z.shape).astype(np.float64))}
+        r, z, turns = [np.atleast_1d(params['HALF_COILS:' + name]).astype(np.float64) for name in ('R', 'Z', 'TURNS')]
+        for i in range(len(r)):
+            out['HALF_COILS_%d' % (i + 1,)] = (r[i:i + 1], z[i:i + 1], .5 * turns[i:i + 1])
+        return out
+    if 'TURNS' in params and 'R' in params:
+        turns = float(params['TURNS']) * direction(params.get('DIRECTION', 'up'))
+        return {'COIL': (np.atleast_1d(params['R']).astype(np.float64),
+                         np.atleast_1d(params['Z']).astype(np.float64), np.array([turns]))}
+    raise ValueError('No coil geometry in parameters %s' % (sorted(params),))
+
+class Table(object):
+    """ Br, Bz and mutual inductance of each coil on a regular (r, z) grid """
+
+    def __init__(self, names, r, z, br, bz, mutual):
+        self.names = [str(name) for name in names]
+        self.r = np.asarray(r, dtype=np.float64)
+        self.z = np.asarray(z, dtype=np.float64)
+        self.br = np.asarray(br)
+        self.bz = np.asarray(bz)
+        self.mutual_table = np.asarray(mutual)
+
+    @classmethod
+    def compute(cls, coils, grid=GRID):
+        r = np.linspace(*grid[0])
+        z = np.linspace(*grid[1])
+        rr, zz = np.meshgrid(r, z, indexing='ij')
+        names = sorted(coils)
+        br, bz, m = [np.zeros((len(names),) + rr.shape) for _ in range(3)]
+        for i, name in enumerate(names):
+            for rc, zc, weight in zip(*coils[name]):
+                loop_br, loop_bz = field(rc, zc, rr, zz)
+                br[i] += weight * loop_br
+                bz[i] += weight * loop_bz
+                m[i] += weight * mutual(rc, zc, rr, zz)
+        return cls(names, r, z, br, bz, m)
+
+    def save(self, filename):
+        np.savez(filename, names=np.array(self.names), r=self.r, z=self.z,
+                 br=self.br, bz=self.bz, mutual=self.mutual_table)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['names'], f['r'], f['z'], f['br'], f['bz'], f['mutual'])
+
+    def interpolate(self, values, r, z):
+        """ bilinear interpolation of values[coil, r, z], shape (coils,) + shape of r and z """
+        r, z = np.broadcast_arrays(np.asarray(r, dtype=np.float64), np.asarray(z, dtype=np.float64))
+        if r.size and (r.min() < self.r[0] or r.max() > self.r[-1] or z.min() < self.z[0] or z.max() > self.z[-1]):
+            raise ValueError('Points outside the table, r %g to %g, z %g to %g' %
+                             (self.r[0], self.r[-1], self.z[0], self.z[-1]))
+        fr = (r - self.r[0]) / (self.r[1] - self.r[0])
+        fz = (z - self.z[0]) / (self.z[1] - self.z[0])
+        i = np.clip(fr.astype(np.intp), 0, len(self.r) - 2)
+        j = np.clip(fz.astype(np.intp), 0, len(self.z) - 2)
+        fr = fr - i
+        fz = fz - j
+        return ((1. - fr) * (1. - fz) * values[:, i, j] + fr * (1. - fz) * values[:, i + 1, j] +
+                (1. - fr) * fz * values[:, i, j + 1] + fr * fz * values[:, i + 1, j + 1])
+
+    def field(self, r, z):
+        """ Br and Bz at (r, z) per ampere in each coil """
+        return self.interpolate(self.br, r, z), self.interpolate(self.bz, r, z)
+
+    def mutual(self, r, z):
+        """ mutual inductance between each coil and a filament loop at (r, z) """
+        return self.interpolate(self.mutual_table, r, z)
+
+_tables = {}
+
+def cache_key(fingerprint, grid=GRID):
+    return hashlib.sha256(('%s %r' % (str(fingerprint).strip(), tuple(map(tuple, grid)))).encode('ascii')).hexdigest()
+
+def table(dev, grid=GRID, cache=CACHE):
+    """ the Table of dev's coils, computed once per contract FINGERPRINT and grid """
+    key = cache_key(dev.fingerprint.data(), grid)
+    if key in _tables:
+        return _tables[key]
+    filename = None if cache is None else os.path.join(cache, key + '.npz')
+    if filename is not None and os.path.exists(filename):
+        result = Table.load(filename)
+    else:
+        result = Table.compute(coils(mpcs_parameters.load(dev)), grid)
+        if filename is not None:
+            if not os.path.isdir(cache):
+                os.makedirs(cache)
+            temporary = filename + '.%d.npz' % (os.getpid(),)
+            result.save(temporary)
+            os.rename(temporary, filename)
+    _tables[key] = result
+    return result
@@ -0,0 +1,220 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    HAL expressions compiled to vectorized NumPy kernels.
+
+    The SIGNALS:*:HAL nodes hold TDI of the form
+
+        _out := <expression of _in>
+
+    which PCS evaluates one sample at a time.  compile_hal translates
+    the arithmetic subset of TDI (numbers, [..] arrays, _in, + - * / **
+    and parentheses) into a function applied to a whole block of
+    samples at once, with one row per sample.  Literals keep their TDI
+    types (1. is a 32 bit float, 1D0 a 64 bit float, 1 a 32 bit int)
+    so the kernel promotes the same way TDI does.
+
+    kernel() caches by node path and expression text, and checks the
+    compiled kernel against TDI on a probe block before it is used.
+    Anything that does not compile, or does not agree with TDI, falls
+    back to evaluating the TDI sample by sample, which is far too slow
+    for the faster contracts, so the reason is printed when debugging.
+
+    A HAL that is a scale and offset per channel can instead be left to
+    read time: affine() fits the scale and offset to the kernel in
+    float64 over the full range of the raw type, and read_expression()
+    builds the TDI that applies them to the raw samples stored in
+    another node, whole signal at a time.
+
+
+"""
+import ast
+import re
+
+import MDSplus
+import numpy as np
+
+_ASSIGN = re.compile(r'^\s*_out\s*:?=\s*(?P<body>.*?)\s*;?\s*$', re.S | re.I)
+_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+_cache = {}
+
+def _literal(text):
+    """ TDI type of a numeric literal """
+    if re.search(r'[dD]', text):
+        return np.float64(float(re.sub(r'[dD]', 'e', text)))
+    if re.search(r'[.eE]', text):
+        return np.float32(float(text))
+    return np.int32(int(text))
+
+class _Translate(ast.NodeTransformer):
+    """ replace literals and [..] arrays with typed constants """
+
+    def __init__(self, literals):
+        self.literals = literals
+        self.constants = {}
+
+    def constant(self, value):
+        name = '_k%d' % len(self.constants)
+        self.constants[name] = value
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, str):
+            raise ValueError('unexpected constant %r' % (node.value,))
+        return self.constant(_literal(self.literals[node.value]))
+
+    def visit_List(self, node):
+        values = []
+        for elt in node.elts:
+            if isinstance(elt, ast.UnaryOp) and isinstance(elt.op, (ast.USub, ast.UAdd)):
+                sign, elt = (-1 if isinstance(elt.op, ast.USub) else 1), elt.operand
+            else:
+                sign = 1
+            if not (isinstance(elt, ast.Constant) and isinstance(elt.value, str)):
+                raise ValueError('only numbers are allowed in HAL arrays')
+            values.append(sign * _literal(self.literals[elt.value]))
+        return self.constant(np.array(values))
+
+    def visit_Name(self, node):
+        if node.id.lower() != '_in':
+            raise ValueError('unknown variable %s' % (node.id,))
+        return ast.Name(id='_in', ctx=ast.Load())
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Load) + _OPS):
+            raise ValueError('unsupported %s in HAL expression' % (type(node).__name__,))
+        return super(_Translate, self).generic_visit(node)
+
+def compile_hal(expr):
+    """
+    Compile a HAL expression into a function of a block of samples.
+    Raises ValueError if the expression is outside the supported subset.
+    """
+    match = _ASSIGN.match(expr)
+    if match is None:
+        raise ValueError('HAL expression must assign _out')
+    literals = {}
+    def quote(m):
+        key = 'n%d' % len(literals)
+        literals[key] = m.group(0)
+        return repr(key)
+    body = re.sub(r'(?<![\w.])(\d+\.?\d*|\.\d+)([dDeE][+-]?\d+)?', quote, match.group('body'))
+    try:
+        tree = ast.parse(body, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(str(e))
+    translate = _Translate(literals)
+    tree = ast.fix_missing_locations(translate.visit(tree))
+    code = compile(tree, '<HAL %s>' % (expr,), 'eval')
+    constants = translate.constants
+    def kernel(block):
+        scope = dict(constants)
+        scope['_in'] = block
+        return eval(code, {'__builtins__': {}}, scope)
+    return kernel
+
+def tdi_hal(expr):
+    """ evaluate the HAL expression with TDI, one sample at a time """
+    expr = '_in = $; ' + expr
+    def kernel(block):
+        return np.array([MDSplus.Data.execute(expr, MDSplus.makeArray(row)).data() for row in block])
+    return kernel
+
+def probe(shape, dtype):
+    """ a small block of test samples """
+    values = np.arange(-8, 8) % 7 - 3
+    block = np.resize(values, (8,) + tuple(shape))
+    if np.dtype(dtype).kind == 'f':
+        block = block * 0.375
+    return block.astype(dtype)
+
+def full_scale(shape, dtype):
+    """ a block of test samples spanning the range of an integer dtype """
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        values = np.round(np.linspace(info.min, info.max, 17))
+    else:
+        values = np.linspace(-1000., 1000., 17)
+    channels = int(np.prod(shape))
+    block = np.stack([np.roll(values, i) for i in range(channels)], axis=1)
+    return block.reshape((len(values),) + tuple(shape)).astype(dtype)
+
+def kernel(node, shape, dtype, phys_type, debug=False):
+    """
+    Kernel for the HAL expression in node, applied to samples of the
+    given shape and raw dtype, with results of phys_type.  With debug
+    says why when it falls back to TDI.
+    """
+    expr = str(node.data())
+    key = (str(node.fullpath), expr)
+    if key not in _cache:
+        fallback = tdi_hal(expr)
+        try:
+            compiled = compile_hal(expr)
+            block = probe(shape, dtype)
+            expected = np.asarray(fallback(block)).astype(phys_type)
+            got = np.broadcast_to(compiled(block), expected.shape).astype(phys_type)
+            if not np.array_equal(got, expected):
+                raise ValueError('compiled HAL does not match TDI')
+            _cache[key] = compiled
+        except (ValueError, TypeError) as e:
+            if debug:
+                print("%s: HAL %s falls back to TDI one sample at a time: %s" % (node.fullpath, expr, e))
+            _cache[key] = fallback
+    return _cache[key]
+
+def affine(kernel, shape, dtype, phys_type):
+    """
+    (scale, offset) per channel such that kernel(block) is
+    block * scale + offset, or ValueError if it is not.
+    """
+    shape = tuple(shape)
+    phys_type = np.dtype(phys_type)
+    if len(shape) != 1 or phys_type.kind != 'f':
+        raise ValueError('Only a HAL from one dimensional samples to floats can be applied on read')
+    block = full_scale(shape, dtype)
+    x = block.astype(np.float64)
+    y = np.broadcast_to(kernel(x), x.shape).astype(np.float64)
+    offset = np.broadcast_to(kernel(np.zeros_like(x[:1])), x[:1].shape)[0].astype(np.float64)
+    scale = (x * (y - offset)).sum(axis=0) / (x * x).sum(axis=0)
+    expected = np.broadcast_to(kernel(block), block.shape).astype(phys_type)
+    got = (x * scale + offset).astype(phys_type)
+    if not np.allclose(got, expected, rtol=1e-6, atol=1e-6 * np.abs(expected).max()):
+        raise ValueError('HAL is not a scale and offset of each channel')
+    return scale.astype(phys_type), offset.astype(phys_type)
+
+def read_expression(raw, scale, offset):
+    """
+    TDI for the physical signal: the samples of the raw node times
+    scale plus offset, per channel, on the raw node's timebase.
+    """
+    scale = np.asarray(scale)
+    convert = 'FT_FLOAT' if scale.dtype == np.float64 else 'FS_FLOAT'
+    return MDSplus.Data.compile('_d = DATA($1); '
+                                'MAKE_SIGNAL(%s(_d) * SPREAD($2, 1, SIZE(_d, 1)) + SPREAD($3, 1, SIZE(_d, 1)), *, DIM_OF($1))'
+                                % (convert,), raw, MDSplus.makeArray(scale), MDSplus.makeArray(np.asarray(offset)))
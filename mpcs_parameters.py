@@ -0,0 +1,127 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Bulk loader for the parameters of an MPCS device.
+
+    load() fetches every node with data under the device's .PARAMETERS
+    with a single TDI evaluation, which is one round trip when the tree
+    is remote over mdsip, instead of one per node.  The values come back
+    keyed by their path below IMMUTTABLE or MUTTABLE, for example
+    RATE, FULL_COIL:Z or HALF_COILS:PHI, as NumPy values or str.
+
+    Parameter is a typed property for the device classes.  The
+    IMMUTTABLE nodes are write_once, so their values are loaded once
+    and converted once per open of a tree, and kept until that Tree
+    object goes away; reopening the tree starts again.
+
+
+"""
+import weakref
+
+import MDSplus
+import numpy as np
+
+EXPR = ('_n = getnci($, "NID_NUMBER"); '
+        '_n = pack(_n, getnci(_n, "LENGTH") > 0); '
+        'List(*, getnci(_n, "FULLPATH"), getnci(_n, "RECORD"))')
+
+SECTIONS = ('.PARAMETERS.IMMUTTABLE', '.PARAMETERS.MUTTABLE')
+
+def key(head_path, path):
+    """ path of a parameter node relative to its IMMUTTABLE / MUTTABLE section """
+    path = str(path).strip()
+    rel = path[len(head_path):] if path.upper().startswith(head_path.upper()) else path
+    for section in SECTIONS:
+        if rel.upper().startswith(section):
+            return rel[len(section):].lstrip('.:')
+    return rel.lstrip('.:')
+
+def value(record):
+    data = record.data() if isinstance(record, MDSplus.Data) else record
+    if isinstance(data, (str, bytes, np.str_, np.bytes_)):
+        return data.decode() if isinstance(data, bytes) else str(data)
+    return np.asarray(data)
+
+def executor(dev, connection=None):
+    return dev.tree.tdiExecute if connection is None else connection.get
+
+def load(dev, connection=None):
+    """
+    Parameters of dev as {path: value}.  With connection, an open
+    MDSplus.Connection to an mdsip server that has dev's tree open,
+    the evaluation happens on the server.
+    """
+    head_path = str(dev.fullpath)
+    paths, records = list(executor(dev, connection)(EXPR, head_path + '.PARAMETERS***'))
+    return dict((key(head_path, path), value(record)) for path, record in zip(np.atleast_1d(value(paths)), records))
+
+def load_each(dev, connection=None):
+    """ the same result fetched one node at a time, for comparison """
+    head_path = str(dev.fullpath)
+    execute = executor(dev, connection)
+    params = {}
+    for path in np.atleast_1d(value(execute('getnci($, "FULLPATH")', head_path + '.PARAMETERS***'))):
+        try:
+            record = execute('getnci($, "RECORD")', str(path).strip())
+        except MDSplus.MdsException:
+            continue
+        params[key(head_path, path)] = value(record)
+    return params
+
+_opened = weakref.WeakKeyDictionary()
+
+def cached(dev):
+    """ load(dev) once per open of dev's tree, and a dict for converted values """
+    per_tree = _opened.setdefault(dev.tree, {})
+    nid = int(dev.nid)
+    if nid not in per_tree:
+        per_tree[nid] = (load(dev), {})
+    return per_tree[nid]
+
+def floats(value):
+    array = np.array(value, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+def ints(value):
+    array = np.array(value, dtype=np.int32)
+    array.flags.writeable = False
+    return array
+
+class Parameter(object):
+    """ an immutable parameter of a device as a property of type convert """
+
+    def __init__(self, name, convert):
+        self.name = name
+        self.convert = convert
+
+    def __get__(self, dev, cls=None):
+        if dev is None:
+            return self
+        params, values = cached(dev)
+        if self.name not in values:
+            values[self.name] = self.convert(params[self.name])
+        return values[self.name]
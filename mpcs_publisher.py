@@ -0,0 +1,167 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Deadline scheduled publisher for actuator contracts.
+
+    Messages go out on the RATE / PHASE grid: message seq is due at
+    seq / RATE + PHASE.  The thread sleeps until just before each
+    absolute deadline and spins for the rest, so timing errors do not
+    accumulate the way they do with a sleep of one period per message.
+    The message is written into a preallocated buffer and the lateness
+    of every send is kept for the shot.
+
+    configure() does the setup, the parameters, buffers and socket, so
+    that start() only has to start the thread.
+
+"""
+import math
+import socket
+import threading
+import time
+
+import MDSplus
+import numpy as np
+
+import mpcs_contract
+import mpcs_parameters
+import mpcs_receiver
+
+SPIN = 0.001
+LEAD = 0.05
+
+def wait_until(deadline, spin=SPIN, clock=time.time):
+    """ sleep then spin until the clock reaches deadline """
+    remaining = deadline - clock()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while clock() < deadline:
+        pass
+
+def open_sender(address, ttl=1):
+    mpcs_receiver.check_address(address)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    return sock
+
+class DemandPublisher(threading.Thread):
+    """
+    Send the rows of program, one per tick of rate, starting at the
+    first tick at least LEAD seconds after start() and ending with
+    the program or stop().
+    """
+
+    def __init__(self, address, port, name, rate, phase, raw_shape, raw_type, program):
+        super(DemandPublisher, self).__init__(name='SDN publish %s:%s' % (address, port))
+        self.daemon = True
+        self.address = (str(address), int(port))
+        self.rate = float(rate)
+        self.phase = float(phase)
+        shape = mpcs_contract.shape_of(raw_shape)
+        self.program = np.asarray(program, dtype=mpcs_contract.raw_dtype(raw_type)).reshape((-1,) + shape)
+        self.message = np.zeros(1, dtype=mpcs_contract.message_dtype(shape, raw_type))
+        self.message['name'] = name
+        self.buffer = memoryview(self.message.view(np.uint8))
+        self.seq = self.message['seq']
+        self.payload = self.message['payload'][0]
+        self.lateness = np.zeros(len(self.program), dtype=np.float64)
+        self.sent = 0
+        self.first = None
+        self.running = False
+        self.sock = open_sender(self.address[0])
+
+    def start(self):
+        self.first = int(math.ceil((time.time() + LEAD - self.phase) * self.rate))
+        self.running = True
+        super(DemandPublisher, self).start()
+
+    def run(self):
+        sendto = self.sock.sendto
+        clock = time.time
+        for k in range(len(self.program)):
+            if not self.running:
+                break
+            seq = self.first + k
+            deadline = seq / self.rate + self.phase
+            self.seq[0] = seq
+            self.payload[...] = self.program[k]
+            wait_until(deadline)
+            sendto(self.buffer, self.address)
+            self.lateness[k] = clock() - deadline
+            self.sent = k + 1
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join()
+        self.sock.close()
+
+    def jitter(self):
+        """ send times and lateness of the messages sent """
+        if self.first is None:
+            return np.zeros(0), np.zeros(0)
+        times = (self.first + np.arange(self.sent)) / self.rate + self.phase
+        return times, self.lateness[:self.sent]
+
+_active = {}
+
+def key(dev):
+    return (str(dev.tree.tree), int(dev.tree.shot), int(dev.nid))
+
+def configure(dev, program):
+    """
+    Set up publishing program, the DEMAND values to send, on the
+    device's contract, ready for start().
+    """
+    if key(dev) in _active:
+        raise Exception('%s: already publishing' % (dev.path,))
+    params = mpcs_parameters.load(dev)
+    _active[key(dev)] = DemandPublisher(dev.comms_address.data(), dev.comms_port.data(),
+                                        mpcs_contract.comms_name(dev),
+                                        params['RATE'], params['PHASE'], params['RAW_SHAPE'], params['RAW_TYPE'],
+                                        program)
+
+def start(dev):
+    """ start sending, if a program was configured """
+    publisher = _active.get(key(dev))
+    if publisher is not None:
+        publisher.start()
+
+def stop(dev, jitter):
+    """ stop publishing and store the lateness of each send in jitter """
+    publisher = _active.pop(key(dev), None)
+    if publisher is None:
+        return
+    publisher.stop()
+    times, lateness = publisher.jitter()
+    if len(times):
+        jitter.record = MDSplus.Signal(lateness, None, times)
+    if dev.debugging():
+        print("%s: sent %d messages, lateness p50 %g p99 %g max %g s" %
+              (dev.path, publisher.sent,
+               np.percentile(lateness, 50) if len(lateness) else 0,
+               np.percentile(lateness, 99) if len(lateness) else 0,
+               lateness.max() if len(lateness) else 0))
@@ -0,0 +1,315 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Multicast receiver for the MPCS SDN data contracts.
+
+    The devices share their multicast groups and tell their messages
+    apart by COMMS:NAME, so a process has one ReceiverService: a single
+    asyncio event loop with one socket per address and port, which
+    routes each datagram by name with recv_into straight into the rows
+    of that contract's preallocated RingBuffer.  There is no per packet
+    allocation on the receive path, and no socket or thread per device.
+
+"""
+import asyncio
+import ipaddress
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import mpcs_contract
+
+RCVBUF = 8 * 1024 * 1024
+
+class RingBuffer(object):
+    """
+    Preallocated single producer / single consumer ring of datagrams.
+
+    head and tail are running counts of slots written and read.
+    Datagrams are only taken into the ring while running.
+    """
+
+    running = True
+
+    def __init__(self, slots, slot_size):
+        self.slots = int(slots)
+        self.data = np.zeros((self.slots, slot_size), dtype=np.uint8)
+        self.sizes = np.zeros(self.slots, dtype=np.int32)
+        self.times = np.zeros(self.slots, dtype=np.float64)
+        self.views = [memoryview(row) for row in self.data]
+        self.head = 0
+        self.tail = 0
+        self.lost = 0
+
+    def occupancy(self):
+        return self.head - self.tail
+
+    def _rows(self, start, stop):
+        first = start % self.slots
+        last = first + (stop - start)
+        if last <= self.slots:
+            index = slice(first, last)
+        else:
+            index = np.r_[first:self.slots, 0:last - self.slots]
+        return self.data[index], self.sizes[index], self.times[index]
+
+    def read(self, limit=None):
+        """
+        Copy out everything written since the last read, oldest first.
+        Slots the producer overwrote before they were read are counted
+        in lost and skipped.
+        """
+        head = self.head
+        start = max(self.tail, head - self.slots)
+        if limit is not None:
+            head = min(head, start + limit)
+        self.lost += start - self.tail
+        data, sizes, times = [a.copy() for a in self._rows(start, head)]
+        overwritten = min(head, self.head - self.slots) - start
+        if overwritten > 0:
+            self.lost += overwritten
+            data, sizes, times = data[overwritten:], sizes[overwritten:], times[overwritten:]
+        self.tail = head
+        return data, sizes, times
+
+class SharedRing(RingBuffer):
+    """
+    RingBuffer in a multiprocessing.shared_memory block, so that a
+    receiver in one process and a writer in another can share it
+    without pickling any data.  The running counts live in the block
+    too: head is only written by the receiver and tail and lost only
+    by the writer, and the running, started and stopping flags only
+    by the receiver's owner, so no lock is needed.  A shared ring
+    starts out not running, and started is when it was set running,
+    in ns.
+    """
+
+    HEAD, TAIL, LOST, STOPPING, RUNNING, STARTED = range(6)
+
+    def __init__(self, slots, slot_size, name=None):
+        self.slots = int(slots)
+        self.slot_size = int(slot_size)
+        sizes = 8 * 8
+        times = sizes + 4 * self.slots
+        data = times + 8 * self.slots
+        total = data + self.slots * self.slot_size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=total)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        buf = self.shm.buf
+        self.control = np.ndarray(8, dtype=np.uint64, buffer=buf)
+        self.sizes = np.ndarray(self.slots, dtype=np.int32, buffer=buf, offset=sizes)
+        self.times = np.ndarray(self.slots, dtype=np.float64, buffer=buf, offset=times)
+        self.data = np.ndarray((self.slots, self.slot_size), dtype=np.uint8, buffer=buf, offset=data)
+        self.views = [memoryview(row) for row in self.data]
+        if self.owner:
+            self.control[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(index):
+        return lambda self: int(self.control[index])
+
+    def _set(index):
+        def set(self, value):
+            self.control[index] = value
+        return set
+
+    head = property(_get(HEAD), _set(HEAD))
+    tail = property(_get(TAIL), _set(TAIL))
+    lost = property(_get(LOST), _set(LOST))
+    stopping = property(_get(STOPPING), _set(STOPPING))
+    running = property(_get(RUNNING), _set(RUNNING))
+    started = property(_get(STARTED), _set(STARTED))
+
+    def close(self):
+        self.views = []
+        del self.control, self.sizes, self.times, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def check_address(address):
+    """
+    address as an ipaddress, which must be a multicast group or a
+    unicast address; reserved ones such as 244.0.0.0 are neither.
+    """
+    try:
+        ip = ipaddress.ip_address(str(address).strip())
+    except ValueError:
+        raise ValueError('COMMS:ADDRESS "%s" is not an IP address' % (address,))
+    if not ip.is_multicast and (ip.is_reserved or ip.is_unspecified):
+        raise ValueError('COMMS:ADDRESS %s is neither a multicast group nor a unicast address' % (ip,))
+    return ip
+
+def open_socket(address, port, interface='0.0.0.0', rcvbuf=RCVBUF):
+    """ bind to port and join address if it is a multicast group """
+    ip = check_address(address)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(('', int(port)))
+    if ip.is_multicast:
+        mreq = struct.pack('4s4s', socket.inet_aton(address), socket.inet_aton(interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+class Group(object):
+    """
+    One socket on one address and port, with the rings of the
+    contracts sharing it keyed by their wire name.  Each datagram's
+    name is peeked at, then it is received straight into the ring of
+    that contract, or discarded if no contract has that name or its
+    ring is not running.
+    """
+
+    def __init__(self, address, port):
+        self.address = str(address)
+        self.port = int(port)
+        self.sock = open_socket(self.address, self.port)
+        self.sock.setblocking(False)
+        self.routes = []
+        self.peek = bytearray(mpcs_contract.NAME_LENGTH)
+        self.discard = bytearray(mpcs_contract.MAX_PACKET)
+        self.discarded = 0
+
+    def add(self, name, ring):
+        if any(route[0] == name for route in self.routes):
+            raise ValueError('%s is already received on %s:%d' % (name.rstrip(b'\0'), self.address, self.port))
+        self.routes.append((name, ring, ring.views))
+
+    def remove(self, ring):
+        self.routes = [route for route in self.routes if route[1] is not ring]
+
+    def readable(self):
+        """ receive everything waiting on the socket """
+        recv_into = self.sock.recv_into
+        peek = self.peek
+        clock = time.time
+        while True:
+            try:
+                recv_into(peek, 0, socket.MSG_PEEK)
+            except (BlockingIOError, InterruptedError):
+                return
+            for name, ring, views in self.routes:
+                if peek == name and ring.running:
+                    slot = ring.head % ring.slots
+                    ring.sizes[slot] = recv_into(views[slot])
+                    ring.times[slot] = clock()
+                    ring.head += 1
+                    break
+            else:
+                recv_into(self.discard)
+                self.discarded += 1
+
+    def close(self):
+        self.sock.close()
+
+class Subscription(object):
+    """ a contract's ring, filled by the service between start() and stop() """
+
+    def __init__(self, service, address, port, name, slot_size, slots, shared=False):
+        self.service = service
+        self.address = str(check_address(address))
+        self.port = int(port)
+        self.name = name
+        self.ring = (SharedRing if shared else RingBuffer)(slots, slot_size)
+
+    def start(self):
+        self.service.call(self.service.add, self)
+
+    def stop(self):
+        self.service.call(self.service.remove, self)
+
+class ReceiverService(object):
+    """
+    A single asyncio event loop, in its own thread, reading every
+    group that any contract in this process receives from.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.groups = {}
+        self.thread = threading.Thread(target=self.loop.run_forever, name='MPCS receiver')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def call(self, func, *args):
+        """ run func in the loop thread and wait for it """
+        async def run():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result()
+
+    def subscribe(self, address, port, name, slot_size, slots, shared=False):
+        return Subscription(self, address, port, name, slot_size, slots, shared)
+
+    def add(self, subscription):
+        key = (subscription.address, subscription.port)
+        group = self.groups.get(key)
+        if group is None:
+            group = Group(*key)
+            self.groups[key] = group
+            self.loop.add_reader(group.sock.fileno(), group.readable)
+        group.add(subscription.name, subscription.ring)
+
+    def remove(self, subscription):
+        key = (subscription.address, subscription.port)
+        group = self.groups.get(key)
+        if group is None:
+            return
+        group.readable()
+        group.remove(subscription.ring)
+        if not group.routes:
+            self.loop.remove_reader(group.sock.fileno())
+            group.close()
+            del self.groups[key]
+
+_service = None
+_service_lock = threading.Lock()
+
+def service():
+    """ the process's ReceiverService, started on first use """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ReceiverService()
+    return _service
+
+def subscribe(address, port, name, slot_size, slots, shared=False):
+    """
+    A Subscription for the messages called name on address:port,
+    with its ring in shared memory if shared.
+    """
+    return service().subscribe(address, port, name, slot_size, slots, shared)
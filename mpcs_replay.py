@@ -0,0 +1,186 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Replay of a stored shot over SDN.
+
+    For every LIFT_COIL, PICKUP_COILS and TOF_SENSORS in a shot a Replay
+    reads its stored signal (SIGNALS:DEMAND, FLUX or HEIGHT) one segment
+    at a time and sends it again in the device's wire format under
+    COMMS:NAME, with the sample times moved to start now and paced at
+    RATE, or a multiple of it, on the PHASE grid, in batches as a
+    mpcs_simulator.Stream sends.  So PCS and the acquisition can be
+    loaded with recorded rather than synthetic data.
+
+    The wire carries raw samples, so the stored values go back through
+    the inverse of the HAL's scale and offset (see mpcs_hal.affine)
+    into the SELECTORS channels of RAW_SHAPE, the rest are zero.  A
+    signal stored raw in FLUX:RAW is sent as it is.
+
+        python mpcs_replay.py TREE SHOT [--multiplier 10] [--interface 127.0.0.1]
+
+"""
+import argparse
+import math
+import sys
+import time
+
+import MDSplus
+import numpy as np
+
+import mpcs_acquisition
+import mpcs_contract
+import mpcs_dispatch
+import mpcs_hal
+import mpcs_parameters
+import mpcs_publisher
+import mpcs_simulator
+
+SIGNALS = {
+    'LIFT_COIL': '.SIGNALS:DEMAND',
+    'PICKUP_COILS': '.SIGNALS:FLUX',
+    'TOF_SENSORS': '.SIGNALS:HEIGHT',
+}
+
+def optional(dev, path):
+    """ the data of dev's node at path, or None if it has none or is not there """
+    try:
+        return dev.getNode(path).data()
+    except MDSplus.MdsException:
+        return None
+
+class Recording(object):
+    """ the stored signal of a device, as raw payloads one segment at a time """
+
+    def __init__(self, dev, model):
+        params = mpcs_parameters.load(dev)
+        self.rate = float(params['RATE'])
+        self.phase = float(params['PHASE'])
+        self.raw_shape = mpcs_contract.shape_of(params['RAW_SHAPE'])
+        self.raw_type = mpcs_contract.raw_dtype(params['RAW_TYPE'])
+        self.signal = dev.getNode(SIGNALS[model])
+        selectors = optional(dev, '.SIGNALS:SELECTORS')
+        self.selector = mpcs_acquisition.selector(params, selectors)
+        raw = dev.getNode(SIGNALS[model] + ':RAW') if model == 'PICKUP_COILS' else None
+        if raw is not None and raw.getNumSegments() > 0:
+            self.node, self.scale, self.offset = raw, None, None
+        else:
+            kernel = mpcs_acquisition.hal_kernel(params, dev.getNode(SIGNALS[model] + ':HAL'), selectors)
+            shape = self.raw_shape if selectors is None else (len(np.atleast_1d(selectors)),)
+            self.node = self.signal
+            self.scale, self.offset = mpcs_hal.affine(kernel, shape, self.raw_type,
+                                                      mpcs_contract.raw_dtype(params['PHYS_TYPE']))
+
+    def encode(self, data):
+        """ raw payloads, RAW_SHAPE of RAW_TYPE, for stored samples """
+        data = np.asarray(data)
+        if self.scale is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                data = np.where(self.scale != 0, (data.astype(np.float64) - self.offset) / self.scale, 0.)
+            data = np.nan_to_num(data)
+            if self.raw_type.kind in 'iu':
+                info = np.iinfo(self.raw_type)
+                data = np.clip(np.round(data), info.min, info.max)
+        payload = np.zeros((len(data),) + self.raw_shape, dtype=self.raw_type)
+        if self.selector is None:
+            payload[:] = data.reshape(payload.shape)
+        else:
+            payload[:, self.selector] = data
+        return payload
+
+    def segments(self):
+        """
+        (seq, payload) of each stored segment, read as they are needed,
+        without the samples of holes the acquisition filled with nan.
+        """
+        for i in range(self.node.getNumSegments()):
+            segment = self.node.getSegment(i)
+            data = np.asarray(segment.data())
+            times = np.asarray(segment.dim_of().data(), dtype=np.float64)[:len(data)]
+            seq = np.round((times - self.phase) * self.rate).astype(np.int64)
+            if data.dtype.kind == 'f':
+                keep = ~np.isnan(data.reshape(len(data), -1)).any(axis=1)
+                if not keep.all():
+                    seq, data = seq[keep], data[keep]
+            yield seq, self.encode(data)
+
+class Replay(mpcs_simulator.Stream):
+    """ a Stream whose messages come from a Recording """
+
+    def __init__(self, contract, recording, multiplier=1., address=None, interface=None):
+        super(Replay, self).__init__(contract, multiplier, address=address, interface=interface)
+        self.name = 'replay %s' % (contract.name.rstrip(b'\0').decode(),)
+        self.recording = recording
+
+    def run(self):
+        contract = self.contract
+        start = time.time() + mpcs_publisher.LEAD
+        first = int(math.ceil((start - contract.phase) * contract.rate))
+        begin = first / contract.rate + contract.phase
+        origin = None
+        for seq, payload in self.recording.segments():
+            if origin is None and len(seq):
+                origin = int(seq[0])
+            for row in range(0, len(seq), mpcs_simulator.BLOCK):
+                ticks = seq[row:row + mpcs_simulator.BLOCK] - origin
+                n = len(ticks)
+                self.seq[:n] = first + ticks
+                self.payload[:n] = payload[row:row + n]
+                if not self.send(begin + ticks / self.rate, np.arange(n), np.ones(n, dtype=bool)):
+                    return
+        self.running = False
+
+def replays(tree, shot, multiplier=1., address=None, interface=None):
+    tree = MDSplus.Tree(tree, shot, 'ReadOnly')
+    out = []
+    for path, model in mpcs_dispatch.find_devices(tree):
+        dev = tree.getNode(path)
+        out.append(Replay(mpcs_simulator.Contract.from_device(dev), Recording(dev, model),
+                          multiplier, address, interface))
+    return out
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Replay the MPCS signals of a shot over SDN')
+    parser.add_argument('tree')
+    parser.add_argument('shot', type=int)
+    parser.add_argument('--multiplier', type=float, default=1., help='times RATE to send at')
+    parser.add_argument('--address', help='send here instead of COMMS:ADDRESS')
+    parser.add_argument('--interface', default='127.0.0.1', help='multicast interface')
+    args = parser.parse_args(argv[1:])
+    streams = replays(args.tree, args.shot, args.multiplier, args.address, args.interface)
+    for stream in streams:
+        stream.start()
+    try:
+        while any(stream.is_alive() for stream in streams):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    for stream in streams:
+        stream.stop()
+        print('%s: %d sent' % (stream.name, stream.sent))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,97 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Segmented storage for the MPCS signals.
+
+    Each SegmentWriter owns one signal node.  Segments hold SEG_LENGTH
+    samples on the RATE / PHASE grid and are preallocated with
+    beginSegment, then filled a block at a time with putSegment, so
+    tree writes scale with blocks rather than samples.
+
+"""
+import MDSplus
+import numpy as np
+
+class SegmentWriter(object):
+
+    def __init__(self, node, rate, phase, seg_length, shape, dtype):
+        self.node = node
+        self.rate = float(rate)
+        self.phase = float(phase)
+        self.seg_length = int(seg_length)
+        if self.seg_length <= 0:
+            raise ValueError('%s: segment length must be positive' % (node.path,))
+        self.template = np.zeros((self.seg_length,) + tuple(shape), dtype=dtype)
+        self.start = None
+        self.filled = 0
+        self.segments = 0
+
+    def time(self, seq):
+        return seq / self.rate + self.phase
+
+    def dim(self, first, count):
+        return MDSplus.Range(self.time(first), self.time(first + count - 1), 1. / self.rate)
+
+    def begin(self, first):
+        self.node.beginSegment(self.time(first), self.time(first + self.seg_length - 1),
+                               self.dim(first, self.seg_length), self.template)
+        self.start = first
+        self.filled = 0
+        self.segments += 1
+
+    def close(self):
+        """ shrink a partly filled last segment to the samples written """
+        if self.start is not None and 0 < self.filled < self.seg_length:
+            self.node.updateSegment(self.time(self.start), self.time(self.start + self.filled - 1),
+                                    self.dim(self.start, self.filled), -1)
+        self.start = None
+        self.filled = 0
+
+    def put(self, seq, block):
+        """
+        Append a block of samples; seq holds the sequence number of
+        each row.  A break in the sequence closes the current segment.
+        """
+        if len(seq) == 0:
+            return
+        breaks = np.flatnonzero(np.diff(seq) != 1) + 1
+        for first, rows in zip(np.split(seq, breaks), np.split(block, breaks)):
+            self._put_run(int(first[0]), rows)
+
+    def _put_run(self, first, rows):
+        if self.start is not None and first != self.start + self.filled:
+            self.close()
+        while len(rows):
+            if self.start is None:
+                self.begin(first)
+            n = min(self.seg_length - self.filled, len(rows))
+            self.node.putSegment(rows[:n], -1)
+            self.filled += n
+            first += n
+            rows = rows[n:]
+            if self.filled == self.seg_length:
+                self.start = None
+                self.filled = 0
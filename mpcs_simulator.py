@@ -0,0 +1,222 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Local SDN traffic for the MPCS data contracts.
+
+    A Stream sends synthetic messages in a contract's wire format at
+    RATE (times a multiplier) on the RATE / PHASE grid, with optional
+    packet loss and send jitter, so the receive path can be tested and
+    stressed without the d-tacq, the TOF sensors or PCS.  Messages are
+    generated a block at a time into a preallocated buffer.  The
+    stream waits only for the next message due, then sends everything
+    that has come due meanwhile without waiting again, so once it falls
+    behind it sends back to back.  Each message is still one sendto
+    from Python, which at the highest multipliers (1 MHz and more) is
+    the limit, so compare sent over the elapsed time with the rate
+    asked for.  A duration sets how many sequence numbers are sent,
+    DURATION * RATE times the multiplier from the first, each sent or
+    dropped however far jitter delays it.
+
+    Contracts come either from the parts of the device classes, or
+    from the devices in a tree:
+
+        python mpcs_simulator.py [--tree TREE --shot SHOT] [--multiplier 10]
+                                 [--loss 0.001] [--jitter 0.0001] [--duration 10]
+
+"""
+import argparse
+import math
+import socket
+import sys
+import threading
+import time
+
+import MDSplus
+import numpy as np
+
+import mpcs_contract
+import mpcs_dispatch
+import mpcs_parameters
+import mpcs_publisher
+
+BLOCK = 1024
+
+class Contract(object):
+    """ what a Stream needs to know about a device """
+
+    def __init__(self, name, address, port, rate, phase, raw_shape, raw_type):
+        self.name = name if isinstance(name, bytes) else mpcs_contract.pad_name(name)
+        self.address = str(address)
+        self.port = int(port)
+        self.rate = float(rate)
+        self.phase = float(phase)
+        self.raw_shape = mpcs_contract.shape_of(raw_shape)
+        self.raw_type = str(raw_type)
+
+    @classmethod
+    def from_parts(cls, model, name=None):
+        """ the defaults in a device class's parts """
+        values = dict((part['path'].upper(), mpcs_parameters.value(part.get('value')))
+                      for part in model.parts if 'value' in part)
+        return cls(name or model.__name__,
+                   values['.COMMS:ADDRESS'], values['.COMMS:PORT'],
+                   values['.PARAMETERS.IMMUTTABLE:RATE'], values['.PARAMETERS.IMMUTTABLE:PHASE'],
+                   values['.PARAMETERS.IMMUTTABLE:RAW_SHAPE'], values['.PARAMETERS.IMMUTTABLE:RAW_TYPE'])
+
+    @classmethod
+    def from_device(cls, dev):
+        """ the values stored in a device instance """
+        params = mpcs_parameters.load(dev)
+        return cls(mpcs_contract.comms_name(dev), dev.getNode('.COMMS:ADDRESS').data(),
+                   dev.getNode('.COMMS:PORT').data(), params['RATE'], params['PHASE'],
+                   params['RAW_SHAPE'], params['RAW_TYPE'])
+
+def waveform(seq, rate, shape, dtype):
+    """ a sine per channel, full scale for integer types """
+    channels = int(np.prod(shape))
+    t = seq[:, None] / rate
+    wave = np.sin(2 * np.pi * (t * (1. + np.arange(channels)) + np.arange(channels) / float(channels)))
+    if np.dtype(dtype).kind in 'iu':
+        wave = wave * (np.iinfo(dtype).max // 2)
+    return wave.astype(dtype).reshape((len(seq),) + tuple(shape))
+
+class Stream(threading.Thread):
+
+    def __init__(self, contract, multiplier=1., loss=0., jitter=0., duration=None,
+                 address=None, interface=None, seed=None):
+        super(Stream, self).__init__(name='simulate %s' % (contract.name.rstrip(b'\0').decode(),))
+        self.daemon = True
+        self.contract = contract
+        self.rate = contract.rate * float(multiplier)
+        self.loss = float(loss)
+        self.jitter = float(jitter)
+        self.duration = duration
+        self.target = (str(address or contract.address), contract.port)
+        self.random = np.random.default_rng(seed)
+        self.block = np.zeros(BLOCK, dtype=mpcs_contract.message_dtype(contract.raw_shape, contract.raw_type))
+        self.block['name'] = contract.name
+        self.seq = self.block['seq']
+        self.payload = self.block['payload']
+        self.rows = [memoryview(row) for row in self.block.view(np.uint8).reshape(BLOCK, -1)]
+        self.sock = mpcs_publisher.open_sender(self.target[0])
+        if interface is not None:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.running = False
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        self.running = True
+        super(Stream, self).start()
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join()
+        self.sock.close()
+
+    def send(self, due, rows, keep):
+        """
+        Send rows of the block, due at the increasing times due, except
+        those keep is False for, which count as dropped: wait for the
+        next one due, then send all that have come due meanwhile.
+        False if stopped before the last.
+        """
+        sendto = self.sock.sendto
+        target = self.target
+        clock = time.time
+        n = len(due)
+        i = 0
+        while i < n:
+            if not self.running:
+                return False
+            mpcs_publisher.wait_until(due[i])
+            j = min(int(np.searchsorted(due, clock(), 'right')), n)
+            j = max(j, i + 1)
+            for row in rows[i:j][keep[i:j]]:
+                sendto(self.rows[row], target)
+            sent = int(np.count_nonzero(keep[i:j]))
+            self.sent += sent
+            self.dropped += j - i - sent
+            i = j
+        return True
+
+    def run(self):
+        contract = self.contract
+        start = time.time() + mpcs_publisher.LEAD
+        first = int(math.ceil((start - contract.phase) * contract.rate))
+        origin = first / contract.rate + contract.phase
+        total = None if self.duration is None else int(math.ceil(float(self.duration) * self.rate))
+        k = 0
+        while self.running and (total is None or k < total):
+            n = BLOCK if total is None else min(BLOCK, total - k)
+            seq = first + k + np.arange(n, dtype=np.uint64)
+            due = origin + (k + np.arange(n)) / self.rate
+            if self.jitter > 0:
+                due = due + np.abs(self.random.normal(0., self.jitter, n))
+            order = np.argsort(due, kind='stable')
+            keep = np.ones(n, dtype=bool)
+            if self.loss > 0:
+                keep = self.random.random(n) >= self.loss
+            self.seq[:n] = seq
+            self.payload[:n] = waveform(seq, contract.rate, contract.raw_shape, self.payload.dtype)
+            self.send(due[order], order, keep[order])
+            k += BLOCK
+
+def contracts(tree=None, shot=-1):
+    if tree is None:
+        return [Contract.from_parts(model) for model in mpcs_dispatch.MODELS.values()]
+    tree = MDSplus.Tree(tree, shot, 'ReadOnly')
+    return [Contract.from_device(tree.getNode(path)) for path, model in mpcs_dispatch.find_devices(tree)]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Simulate MPCS SDN traffic')
+    parser.add_argument('--tree', help='take the contracts from the devices in this tree')
+    parser.add_argument('--shot', type=int, default=-1)
+    parser.add_argument('--multiplier', type=float, default=1., help='times RATE to send at')
+    parser.add_argument('--loss', type=float, default=0., help='fraction of messages to drop')
+    parser.add_argument('--jitter', type=float, default=0., help='rms send delay in seconds')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to run')
+    parser.add_argument('--address', help='send here instead of COMMS:ADDRESS')
+    parser.add_argument('--interface', help='multicast interface, e.g. 127.0.0.1')
+    args = parser.parse_args(argv[1:])
+    streams = [Stream(contract, args.multiplier, args.loss, args.jitter, args.duration,
+                      args.address, args.interface)
+               for contract in contracts(args.tree, args.shot)]
+    for stream in streams:
+        stream.start()
+    try:
+        while any(stream.is_alive() for stream in streams):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    for stream in streams:
+        stream.stop()
+        print('%s: %d sent, %d dropped' % (stream.name, stream.sent, stream.dropped))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,269 @@
+#
+# Copyright (c) 2018, Massachusetts Institute of Technology All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+
+    Common timebase for MPCS signals of different rates.
+
+    Each contract samples on its own grid, seq / RATE + PHASE, so
+    TOF_SENSORS at 100 Hz, LIFT_COIL at 500 Hz and PICKUP_COILS at
+    10 kHz never share a sample time.  A Resampler takes the (seq,
+    block) of one signal, a block at a time, and returns its values at
+    the points k / GRID_RATE + GRID_PHASE of a chosen grid as soon as
+    the samples they depend on have been seen, keeping only those
+    samples from one block to the next.  The grid positions are worked
+    out from the integers seq and k, so grids that coincide do so
+    exactly however large seq is.
+
+    METHODS are
+
+       hold      the last sample at or before each point
+       linear    between the two samples around each point
+       decimate  linear on the signal low pass filtered below the
+                 grid's Nyquist rate, a windowed sinc of WIDTH grid
+                 periods each side, evaluated only at the samples the
+                 points need; the same as linear when the grid is not
+                 coarser than the signal
+
+    The grid runs from the first sample to the last.  A point without
+    the samples it needs, in a break in the sequence or too near either
+    end for the filter, is nan.
+
+    align() steps several Sources together and yields each stretch of
+    grid that all of them cover as (times, [block of each source]),
+    reading from whichever source is behind, so only a few blocks of
+    each are ever in memory.  A Source reads a signal a segment at a
+    time from a tree, or a block of rows at a time from a
+    mpcs_export.Shot.
+
+        sources = [mpcs_timebase.Source.from_node(tree.getNode(path), '.SIGNALS:' + signal)
+                   for path, signal in (('TOP:TOF', 'HEIGHT'), ('TOP:PICKUP', 'FLUX'))]
+        for times, (height, flux) in mpcs_timebase.align(sources, 1000.):
+            ...
+
+"""
+import fractions
+import math
+
+import numpy as np
+
+METHODS = ('hold', 'linear', 'decimate')
+WIDTH = 4
+CUTOFF = 0.9
+ROWS = 100000
+EPS = 1e-6
+
+def exact(value):
+    return fractions.Fraction(float(value))
+
+def lowpass(ratio, width=WIDTH, cutoff=CUTOFF):
+    """
+    Taps of a Blackman windowed sinc with unit gain at DC, cutting off
+    at cutoff times the Nyquist rate of a grid ratio times coarser than
+    the signal.
+    """
+    half = int(math.ceil(width * ratio))
+    n = np.arange(-half, half + 1)
+    taps = np.sinc(cutoff * n / ratio) * np.blackman(2 * half + 3)[1:-1]
+    return taps / taps.sum()
+
+class Resampler(object):
+    """ one signal at rate and phase onto the grid at grid_rate and grid_phase """
+
+    def __init__(self, rate, phase, grid_rate, grid_phase=0., method='linear'):
+        if method not in METHODS:
+            raise ValueError('Unknown resampling method "%s", not one of %s' % (method, ', '.join(METHODS)))
+        self.rate = float(rate)
+        self.phase = float(phase)
+        self.grid_rate = float(grid_rate)
+        self.grid_phase = float(grid_phase)
+        self.method = method
+        self.ratio = self.rate / self.grid_rate
+        if method == 'decimate' and self.ratio > 1:
+            self.taps = lowpass(self.ratio)
+        else:
+            self.taps = np.ones(1)
+        self.half = len(self.taps) // 2
+        self.origin = None
+        self.seq = np.zeros(0, dtype=np.int64)
+        self.data = None
+
+    def begin(self, origin):
+        """ number the grid from the first point at or after sample origin """
+        self.origin = origin
+        start = (exact(origin) / exact(self.rate) + exact(self.phase) - exact(self.grid_phase)) * exact(self.grid_rate)
+        self.k0 = self.k = math.ceil(start - exact(EPS))
+        self.pos0 = float(((self.k0 / exact(self.grid_rate) + exact(self.grid_phase) - exact(self.phase))
+                           * exact(self.rate)) - origin)
+
+    def positions(self, count):
+        """ positions, in samples after origin, of the next count points """
+        pos = self.pos0 + (self.k - self.k0 + np.arange(count)) * self.ratio
+        nearest = np.round(pos)
+        return np.where(np.abs(pos - nearest) < EPS, nearest, pos)
+
+    def apply(self, seq, block):
+        """
+        (k, values) from block, samples seq of the signal: the grid
+        points that are now known, numbered k, and their values.
+        """
+        seq = np.asarray(seq, dtype=np.int64)
+        block = np.asarray(block, dtype=np.float64)
+        if len(seq) == 0:
+            return self.empty(block.shape[1:])
+        if self.origin is None:
+            self.begin(int(seq[0]))
+            self.data = np.zeros((0,) + block.shape[1:])
+        self.seq = np.concatenate((self.seq, seq - self.origin))
+        self.data = np.concatenate((self.data, block))
+        return self.emit(False)
+
+    def finish(self):
+        """ the points left up to the last sample """
+        if len(self.seq) == 0:
+            return self.empty(() if self.data is None else self.data.shape[1:])
+        return self.emit(True)
+
+    def empty(self, shape):
+        return np.zeros(0, dtype=np.int64), np.zeros((0,) + tuple(shape))
+
+    def emit(self, last):
+        end = self.seq[-1]
+        count = max(int((end + 1 - self.positions(1)[0]) / self.ratio) + 2, 0)
+        pos = self.positions(count)
+        left = np.floor(pos).astype(np.int64)
+        if self.method == 'hold':
+            known = left <= end
+        elif last:
+            known = pos <= end
+        else:
+            known = np.ceil(pos).astype(np.int64) + self.half <= end
+        count = int(np.count_nonzero(known))
+        pos, left = pos[:count], left[:count]
+        k = self.k + np.arange(count, dtype=np.int64)
+        values = self.values(left)
+        if self.method != 'hold':
+            frac = (pos - left).reshape((-1,) + (1,) * (values.ndim - 1))
+            right = np.where(frac > 0, self.values(left + 1), 0.)
+            values = np.where(frac > 0, values * (1 - frac) + right * frac, values)
+        self.k += count
+        keep = np.searchsorted(self.seq, np.floor(self.positions(1)[0]) - self.half)
+        self.seq, self.data = self.seq[keep:], self.data[keep:]
+        return k, values
+
+    def values(self, samples):
+        """ the (filtered) signal at samples, nan where it is missing """
+        rows = np.searchsorted(self.seq, samples)
+        half = self.half
+        first, last = rows - half, rows + half
+        valid = (first >= 0) & (last < len(self.seq))
+        first, last = np.where(valid, first, 0), np.where(valid, last, 0)
+        valid &= (self.seq[last] - self.seq[first] == 2 * half) & (self.seq[np.where(valid, rows, 0)] == samples)
+        if len(self.seq) < len(self.taps):
+            values = np.full(samples.shape + self.data.shape[1:], np.nan)
+        elif half:
+            windows = np.lib.stride_tricks.sliding_window_view(self.data, len(self.taps), axis=0)
+            values = np.tensordot(windows[first], self.taps, axes=([-1], [0]))
+        else:
+            values = self.data[first]
+        values[~valid] = np.nan
+        return values
+
+class Source(object):
+    """
+    (seq, block) of a signal sampled at rate and phase, read chunk by
+    chunk each time it is iterated; chunks() gives the (times, data).
+    """
+
+    def __init__(self, rate, phase, chunks):
+        self.rate = float(rate)
+        self.phase = float(phase)
+        self.chunks = chunks
+
+    def __iter__(self):
+        for times, data in self.chunks():
+            data = np.asarray(data)
+            times = np.asarray(times, dtype=np.float64)[:len(data)]
+            yield np.round((times - self.phase) * self.rate).astype(np.int64), data
+
+    @classmethod
+    def from_node(cls, head, path, factor=1):
+        """ path below an MPCS device head in a tree, a segment at a time """
+        import mpcs_export
+        import mpcs_parameters
+        params = mpcs_parameters.load(head)
+        node = head.getNode(path)
+        return cls(float(params['RATE']) / factor, params['PHASE'], lambda: mpcs_export.chunks(node))
+
+    @classmethod
+    def from_export(cls, shot, device, signal, factor=1, rows=ROWS):
+        """ signal of device in a mpcs_export.Shot, rows at a time """
+        params = shot.parameters(device)
+        def chunks():
+            times, data = shot.times(device, signal), shot.data(device, signal)
+            for i in range(0, len(times), rows):
+                yield times[i:i + rows], data[i:i + rows]
+        return cls(float(params['RATE']) / factor, params['PHASE'], chunks)
+
+def align(sources, grid_rate, grid_phase=0., method='linear'):
+    """
+    Yield (times, [block of each source]) on the grid k / grid_rate +
+    grid_phase, a stretch at a time, over the points all of the
+    sources cover.
+    """
+    resamplers = [Resampler(source.rate, source.phase, grid_rate, grid_phase, method) for source in sources]
+    readers = [iter(source) for source in sources]
+    pending = [[] for source in sources]
+    ends = [None] * len(sources)
+    done = [False] * len(sources)
+    start = None
+    while not all(done):
+        behind = min(range(len(sources)), key=lambda i: (done[i], -1 if ends[i] is None else ends[i]))
+        try:
+            k, values = resamplers[behind].apply(*next(readers[behind]))
+        except StopIteration:
+            k, values = resamplers[behind].finish()
+            done[behind] = True
+        if len(k):
+            pending[behind].append((k, values))
+            ends[behind] = int(k[-1]) + 1
+        if done[behind] and ends[behind] is None:
+            return
+        if None in ends:
+            continue
+        if start is None:
+            start = max(int(stretch[0][0][0]) for stretch in pending)
+        end = min(ends)
+        if end > start:
+            blocks = []
+            for i, stretch in enumerate(pending):
+                k = np.concatenate([k for k, values in stretch])
+                values = np.concatenate([values for k, values in stretch])
+                first, stop = np.searchsorted(k, (start, end))
+                blocks.append(values[first:stop])
+                pending[i] = [(k[stop:], values[stop:])]
+            yield np.arange(start, end) / float(grid_rate) + float(grid_phase), blocks
+            start = end
+        if any(done[i] and ends[i] <= start for i in range(len(sources))):
+            return
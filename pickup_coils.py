@@ -27,6 +27,12 @@ import time
 import datetime
 import numpy as np
 
+import mpcs_acquisition
+import mpcs_contract
+import mpcs_derived
+import mpcs_diagnostics
+import mpcs_parameters
+
 class PICKUP_COILS(MDSplus.Device):
     """
 
@@ -65,11 +71,35 @@ class PICKUP_COILS(MDSplus.Device):
        SDN
 
     Methods:
-       check - make sure Recipe matches, what else
+       check - make sure Recipe matches, compares the FINGERPRINT
+               stored by Add with PCS_PRINT, the one from PCS
+       verify - recompute the FINGERPRINT from the immutable
+               parameters and compare it with the stored one
        configure
        start
        stop
 
+    CONFIG arms the acquisition so that START only has to set it
+    running, and STOP finishes it, see mpcs_acquisition.
+
+    START begins acquisition, the selected channels are stored in
+    SIGNALS:FLUX as segments of SIGNALS:SEG_LENGTH samples until STOP,
+    and their drift corrected time integral in SIGNALS:INTEGRAL.  The
+    drift is the mean of the first SIGNALS:FLUX:BASELINE seconds after
+    START, so START must come far enough ahead of the shot.
+
+    With SIGNALS:STORE_RAW set the selected raw shorts are stored in
+    FLUX:RAW instead, compressed if SIGNALS:COMPRESS is set, and FLUX
+    becomes an expression applying the HAL's scale and offset on read.
+
+    FLUX:MIN_10, MAX_10, MEAN_10 and so on to MEAN_1000 hold the min,
+    max and mean of each 10, 100 and 1000 samples, for browsing with
+    mpcs_derived.read().
+
+    The immutable parameters are also typed properties, rate, phase,
+    raw_shape, full_coil_z, half_coils_phi and so on, loaded once per
+    open of the tree.
+
     debugging() - is debugging enabled.
                   Controlled by environment variable DEBUG_DEVICES
     """
@@ -87,6 +117,18 @@ class PICKUP_COILS(MDSplus.Device):
           'options': ('write_once', 'no_write_shot',),
           'help':'The GUID of this instance.'
         },
+        {
+          'path': ':FINGERPRINT',
+          'type': 'text',
+          'options': ('write_once', 'no_write_shot',),
+          'help':'sha256 of GUID and the immutable parameters, set by Add'
+        },
+        {
+          'path': ':PCS_PRINT',
+          'type': 'text',
+          'options': ('no_write_model', 'write_once',),
+          'help':'FINGERPRINT of the contract as PCS has it, written by PCS before CHECK'
+        },
         {
           'path': ':NAME',
           'type': 'text',
@@ -110,21 +152,21 @@ class PICKUP_COILS(MDSplus.Device):
         {
           'path': '.PARAMETERS.IMMUTTABLE:RAW_SHAPE',
           'type': 'numeric',
-          'value': 1,
+          'value': 32,
           'options': ('no_write_shot','write_once',),
           'help':'Shape of data on the wire'
         },
         {
           'path': '.PARAMETERS.IMMUTTABLE:PHYS_SHAPE',
           'type': 'numeric',
-          'value': 1,
+          'value': 3,
           'options': ('no_write_shot','write_once',),
           'help':'Shape of data in physics Units'
         },
         {
           'path': '.PARAMETERS.IMMUTTABLE:RAW_TYPE',
           'type': 'text',
-          'value': 'float',
+          'value': 'short',
           'options': ('no_write_shot','write_once',),
           'help':'Type of the data on the wire'
         },
@@ -241,6 +283,39 @@ class PICKUP_COILS(MDSplus.Device):
           'options': ('no_write_shot',),
           'help':'Expression to make values from demand voltages'
         },
+        {
+          'path': '.SIGNALS:FLUX:BASELINE',
+          'type': 'numeric',
+          'value': 0.5,
+          'options': ('no_write_shot',),
+          'help':'Seconds at the start of acquisition averaged for the drift of each channel'
+        },
+        {
+          'path': '.SIGNALS:FLUX:RAW',
+          'type': 'signal',
+          'options': ('no_write_model','write_once',),
+          'help':'Selected raw samples when STORE_RAW is set, FLUX is then this with HAL applied on read'
+        },
+        {
+          'path': '.SIGNALS:STORE_RAW',
+          'type': 'numeric',
+          'value': 0,
+          'options': ('no_write_shot',),
+          'help':'Store the raw samples in FLUX:RAW and apply the HAL on read, needs an affine HAL and GAP_FILL hold'
+        },
+        {
+          'path': '.SIGNALS:COMPRESS',
+          'type': 'numeric',
+          'value': 0,
+          'options': ('no_write_shot',),
+          'help':'Compress the stored segments of FLUX:RAW'
+        },
+        {
+          'path': '.SIGNALS:INTEGRAL',
+          'type': 'signal',
+          'options': ('no_write_model','write_once',),
+          'help':'Time integral of FLUX in Wb, less the drift, zero until BASELINE ends'
+        },
         {
           'path': '.SIGNALS:MAX_MISSING',
           'type': 'numeric',
@@ -262,7 +337,7 @@ class PICKUP_COILS(MDSplus.Device):
         {
           'path': '.COMMS:ADDRESS',
           'type': 'text',
-          'value': '244.0.0.0',
+          'value': '239.0.0.1',
           'options': ('no_write_shot','write_once',),
           'help':'Multicast address'
         },
@@ -303,7 +378,21 @@ class PICKUP_COILS(MDSplus.Device):
           'valueExpr': "Action(Dispatch('S','DONE',50,None),Method(None,'STOP',head))", 
           'options': ('no_write_shot',)
         },
-    ]
+    ] + mpcs_derived.pyramid_parts('.SIGNALS:FLUX') + mpcs_diagnostics.parts(10000)
+
+    rate = mpcs_parameters.Parameter('RATE', float)
+    phase = mpcs_parameters.Parameter('PHASE', float)
+    raw_shape = mpcs_parameters.Parameter('RAW_SHAPE', mpcs_contract.shape_of)
+    raw_type = mpcs_parameters.Parameter('RAW_TYPE', str)
+    phys_shape = mpcs_parameters.Parameter('PHYS_SHAPE', mpcs_contract.shape_of)
+    phys_type = mpcs_parameters.Parameter('PHYS_TYPE', str)
+    full_coil_r = mpcs_parameters.Parameter('FULL_COIL:R', float)
+    full_coil_z = mpcs_parameters.Parameter('FULL_COIL:Z', mpcs_parameters.floats)
+    full_coil_turns = mpcs_parameters.Parameter('FULL_COIL:TURNS', mpcs_parameters.ints)
+    half_coils_r = mpcs_parameters.Parameter('HALF_COILS:R', mpcs_parameters.floats)
+    half_coils_z = mpcs_parameters.Parameter('HALF_COILS:Z', mpcs_parameters.floats)
+    half_coils_turns = mpcs_parameters.Parameter('HALF_COILS:TURNS', mpcs_parameters.ints)
+    half_coils_phi = mpcs_parameters.Parameter('HALF_COILS:PHI', mpcs_parameters.floats)
 
     debug = None
 
@@ -318,5 +407,33 @@ class PICKUP_COILS(MDSplus.Device):
         import uuid
         head = super(PICKUP_COILS, PICKUP_COILS).Add(*a, **ka)
         head.this_guid.record = str(uuid.uuid4())
+        head.fingerprint.record = mpcs_contract.contract_fingerprint(head, PICKUP_COILS.parts)
         return head
 
+    def CHECK(self, expected=None):
+        mpcs_contract.check(self, expected)
+
+    def VERIFY(self):
+        mpcs_contract.verify(self, PICKUP_COILS.parts)
+
+    def store_raw(self):
+        return bool(self.signals_store_raw.data())
+
+    def CONFIG(self):
+        import mpcs_dispatch
+        mpcs_dispatch.config(self)
+
+    def arm(self):
+        integrator = mpcs_derived.Integrator(self.signals_flux_baseline.data(), [self.signals_integral])
+        mpcs_acquisition.configure(self, self.signals_flux, self.signals_flux_hal, self.signals_selectors.data(),
+                                   derived=[integrator] + mpcs_derived.pyramid(self.signals_flux),
+                                   raw=self.signals_flux_raw if self.store_raw() else None,
+                                   compress=self.signals_compress.data())
+
+    def START(self):
+        if not mpcs_acquisition.armed(self):
+            self.arm()
+        mpcs_acquisition.start(self)
+
+    def STOP(self):
+        mpcs_acquisition.stop(self)
@@ -0,0 +1,72 @@
+"""
+Selectors and the decoding of received message blocks.
+"""
+import numpy as np
+import pytest
+
+import mpcs_contract
+
+@pytest.mark.parametrize('selectors, expected', [
+    ([0, 1, 2, 3], slice(0, 4, 1)),
+    ([2, 5, 8], slice(2, 9, 3)),
+    ([7], slice(7, 8, 1)),
+])
+def test_even_selectors_give_a_slice(selectors, expected):
+    index = mpcs_contract.selector(selectors, 16)
+    assert index == expected
+    block = np.arange(32).reshape(2, 16)
+    np.testing.assert_array_equal(block[:, index], block[:, selectors])
+
+@pytest.mark.parametrize('selectors', [[0, 1, 3], [3, 2, 1], [4, 4]])
+def test_other_selectors_give_an_index(selectors):
+    index = mpcs_contract.selector(selectors, 16)
+    assert isinstance(index, np.ndarray)
+    np.testing.assert_array_equal(index, selectors)
+
+@pytest.mark.parametrize('selectors, raw_shape, phys_shape', [
+    ([0, 16], 16, None),
+    ([-1, 2], 16, None),
+    ([], 16, None),
+    ([0.5, 1.5], 16, None),
+    ([0, 1], [4, 4], None),
+    ([0, 1, 2], 16, 2),
+])
+def test_bad_selectors(selectors, raw_shape, phys_shape):
+    with pytest.raises(ValueError):
+        mpcs_contract.selector(selectors, raw_shape, phys_shape)
+
+def messages(name, seqs, payloads, raw_shape, raw_type, slot_size):
+    """ a received block: each message in a slot_size row """
+    dtype = mpcs_contract.message_dtype(raw_shape, raw_type)
+    records = np.zeros(len(seqs), dtype=dtype)
+    records['name'] = mpcs_contract.pad_name(name)
+    records['seq'] = seqs
+    records['payload'] = payloads
+    block = np.zeros((len(seqs), slot_size), dtype=np.uint8)
+    block[:, :dtype.itemsize] = records.view(np.uint8).reshape(len(seqs), -1)
+    return block, np.full(len(seqs), dtype.itemsize, dtype=np.int32)
+
+def test_decoder():
+    decoder = mpcs_contract.Decoder(mpcs_contract.pad_name('TOF'), 4, 'float')
+    payloads = np.arange(20, dtype=np.float32).reshape(5, 4)
+    block, sizes = messages('TOF', [7, 8, 9, 10, 11], payloads, 4, 'float', decoder.slot_size)
+    keep, seq, payload = decoder.decode(block, sizes)
+    assert keep.all()
+    np.testing.assert_array_equal(seq, [7, 8, 9, 10, 11])
+    np.testing.assert_array_equal(payload, payloads)
+
+def test_decoder_drops_other_names_and_sizes():
+    decoder = mpcs_contract.Decoder(mpcs_contract.pad_name('TOF'), 4, 'float')
+    payloads = np.arange(16, dtype=np.float32).reshape(4, 4)
+    block, sizes = messages('TOF', [1, 2, 3, 4], payloads, 4, 'float', decoder.slot_size)
+    other, other_sizes = messages('LIFT', [2], payloads[1:2], 4, 'float', decoder.slot_size)
+    block[1], sizes[1] = other[0], other_sizes[0]
+    sizes[2] = decoder.slot_size
+    keep, seq, payload = decoder.decode(block, sizes)
+    np.testing.assert_array_equal(keep, [True, False, False, True])
+    np.testing.assert_array_equal(seq, [1, 4])
+    np.testing.assert_array_equal(payload, payloads[[0, 3]])
+
+def test_decoder_is_built_once():
+    name = mpcs_contract.pad_name('PICKUP')
+    assert mpcs_contract.decoder(name, 8, 'short') is mpcs_contract.decoder(name, [8], 'short')
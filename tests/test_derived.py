@@ -0,0 +1,76 @@
+"""
+The derived signal transforms give the same whatever the block
+boundaries, and Decimate's windows follow the sequence.
+"""
+import numpy as np
+import pytest
+
+import mpcs_derived
+
+class Node(object):
+
+    def __init__(self, fullpath):
+        self.fullpath = fullpath
+
+def run(transform, seq, block, sizes):
+    """ (seq, outputs) of transform fed blocks of sizes, then finished """
+    steps, start = [], 0
+    for size in sizes:
+        steps.append(transform.apply(seq[start:start + size], block[start:start + size]))
+        start += size
+    steps.append(transform.finish())
+    seq = np.concatenate([step[0] for step in steps])
+    outputs = [np.concatenate([step[1][i] for step in steps if len(step[0])]) for i in range(len(transform.paths))]
+    return seq, outputs
+
+SPLITS = [[95], [1] * 95, [3, 7, 10, 1, 44, 30], [23, 50, 22]]
+
+@pytest.mark.parametrize('sizes', SPLITS)
+def test_decimate_windows_follow_seq(sizes):
+    seq = np.arange(7, 102, dtype=np.int64)
+    block = np.column_stack((seq, -seq)).astype(np.float64)
+    block[20] = np.nan
+    decimate = mpcs_derived.Decimate(Node('\\T::TOP:D.SIGNALS:X'), 10)
+    assert decimate.paths[0] == '\\T::TOP:D.SIGNALS:X:MIN_10'
+    windows, (low, high, mean) = run(decimate, seq, block, sizes)
+    np.testing.assert_array_equal(windows, np.arange(0, 11))
+    np.testing.assert_array_equal(low[:, 0], [7] + list(range(10, 110, 10)))
+    np.testing.assert_array_equal(high[:, 0], list(range(9, 100, 10)) + [101])
+    np.testing.assert_array_equal(mean[:, 0], [8, 14.5, np.mean([n for n in range(20, 30) if n != 27])] +
+                                  [n + 4.5 for n in range(30, 100, 10)] + [100.5])
+    np.testing.assert_array_equal(mean[:, 1], -mean[:, 0])
+
+def test_decimate_keeps_the_dtype():
+    seq = np.arange(30, dtype=np.int64)
+    block = np.arange(60, dtype=np.float32).reshape(30, 2)
+    windows, outputs = run(mpcs_derived.Decimate(Node('X'), 10), seq, block, [30])
+    assert [output.dtype for output in outputs] == [np.float32] * 3
+
+@pytest.mark.parametrize('sizes', SPLITS)
+def test_integrator_across_blocks(sizes):
+    rate = 100.
+    seq = np.arange(1000, 1095, dtype=np.int64)
+    block = np.column_stack((np.full(95, 2.), np.where(seq < 1010, 1., 3.)))
+    block[50] = np.nan
+    integrator = mpcs_derived.Integrator(0.1, [Node('A')])
+    integrator.configure(rate, 0.)
+    out_seq, (out,) = run(integrator, seq, block, sizes)
+    np.testing.assert_array_equal(out_seq, seq)
+    np.testing.assert_array_equal(out[:10], 0.)
+    counts = np.cumsum(seq[10:] != 1050)
+    np.testing.assert_allclose(out[10:, 0], 0.)
+    np.testing.assert_allclose(out[10:, 1], 2. * counts / rate)
+
+def test_plane():
+    r, phi = [.02, .03, .02, .025], [0., 90., 180., 270.]
+    z = np.array([.06, .07, .065, .068])
+    x, y = np.array(r) * np.cos(np.radians(phi)), np.array(r) * np.sin(np.radians(phi))
+    fits = np.array([[.1, .5, -.3], [.12, 0., .2]])
+    surface = fits[:, :1] + fits[:, 1:2] * x + fits[:, 2:] * y
+    plane = mpcs_derived.Plane(mpcs_derived.plane_pinv(r, phi), [Node('Z'), Node('X'), Node('Y')], z)
+    seq, outputs = plane.apply(np.arange(2), surface - z)
+    np.testing.assert_allclose(np.column_stack(outputs), fits, atol=1e-12)
+
+def test_plane_needs_three_sensors_off_a_line():
+    with pytest.raises(ValueError):
+        mpcs_derived.plane_pinv([.02, .02], [0., 180.])
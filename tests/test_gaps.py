@@ -0,0 +1,83 @@
+"""
+GapDetector on blocks out of order, late, repeated and with holes.
+"""
+import numpy as np
+import pytest
+
+import mpcs_gaps
+
+def block_of(seq):
+    """ one channel whose value is its seq, so filled rows are easy to spot """
+    return np.asarray(seq, dtype=np.float64).reshape(-1, 1)
+
+def test_sorted_block_passes_through():
+    gaps = mpcs_gaps.GapDetector(10)
+    seq, block = gaps.check(np.arange(5, 10, dtype=np.uint64), block_of(range(5, 10)))
+    np.testing.assert_array_equal(seq, np.arange(5, 10))
+    np.testing.assert_array_equal(block, block_of(range(5, 10)))
+    assert (gaps.missing, gaps.late, gaps.last) == (0, 0, 9)
+
+def test_unsorted_block_is_sorted():
+    gaps = mpcs_gaps.GapDetector(10)
+    order = [3, 0, 4, 1, 2]
+    seq, block = gaps.check(np.array(order, dtype=np.uint64), block_of(order))
+    np.testing.assert_array_equal(seq, np.arange(5))
+    np.testing.assert_array_equal(block, block_of(range(5)))
+    assert gaps.missing == 0
+
+def test_late_and_repeated_samples_are_dropped():
+    gaps = mpcs_gaps.GapDetector(10)
+    gaps.check(np.arange(10, dtype=np.uint64), block_of(range(10)))
+    late = [8, 10, 11, 11, 9, 12]
+    seq, block = gaps.check(np.array(late, dtype=np.uint64), block_of(late))
+    np.testing.assert_array_equal(seq, [10, 11, 12])
+    np.testing.assert_array_equal(block, block_of([10, 11, 12]))
+    assert (gaps.late, gaps.missing) == (3, 0)
+
+def test_block_of_only_late_samples():
+    gaps = mpcs_gaps.GapDetector(10)
+    gaps.check(np.arange(10, dtype=np.uint64), block_of(range(10)))
+    seq, block = gaps.check(np.array([3, 4], dtype=np.uint64), block_of([3, 4]))
+    assert len(seq) == len(block) == 0
+    assert (gaps.late, gaps.last) == (2, 9)
+
+def test_nan_fill():
+    gaps = mpcs_gaps.GapDetector(10, 'nan')
+    seq, block = gaps.check(np.array([0, 1, 4, 5], dtype=np.uint64), block_of([0, 1, 4, 5]))
+    np.testing.assert_array_equal(seq, np.arange(6))
+    np.testing.assert_array_equal(block, block_of([0, 1, np.nan, np.nan, 4, 5]))
+    assert (gaps.missing, gaps.worst, gaps.starts, gaps.counts) == (2, 2, [2], [2])
+
+def test_hold_fill_across_blocks():
+    gaps = mpcs_gaps.GapDetector(10, 'hold')
+    gaps.check(np.arange(3, dtype=np.uint64), block_of(range(3)))
+    seq, block = gaps.check(np.array([5, 6, 8], dtype=np.uint64), block_of([5, 6, 8]))
+    np.testing.assert_array_equal(seq, np.arange(3, 9))
+    np.testing.assert_array_equal(block, block_of([2, 2, 5, 6, 6, 8]))
+    assert (gaps.missing, gaps.starts, gaps.counts) == (3, [3, 7], [2, 1])
+
+def test_long_hole_is_left_as_a_break():
+    gaps = mpcs_gaps.GapDetector(3, 'nan')
+    seq, block = gaps.check(np.array([0, 1, 6, 7, 9], dtype=np.uint64), block_of([0, 1, 6, 7, 9]))
+    np.testing.assert_array_equal(seq, [0, 1, 6, 7, 8, 9])
+    np.testing.assert_array_equal(block, block_of([0, 1, 6, 7, np.nan, 9]))
+    assert (gaps.missing, gaps.worst) == (5, 4)
+
+def test_fault_once_total_exceeds_max_missing():
+    gaps = mpcs_gaps.GapDetector(4, 'nan')
+    gaps.check(np.array([0, 2, 4], dtype=np.uint64), block_of([0, 2, 4]))
+    gaps.check(np.array([6, 8], dtype=np.uint64), block_of([6, 8]))
+    assert gaps.missing == 4 and gaps.fault is None
+    gaps.check(np.array([10], dtype=np.uint64), block_of([10]))
+    assert gaps.missing == 5
+    assert isinstance(gaps.fault, mpcs_gaps.MissingSamplesError)
+    assert 'seq 10' in str(gaps.fault)
+    first = gaps.fault
+    gaps.check(np.array([12], dtype=np.uint64), block_of([12]))
+    assert gaps.fault is first
+
+def test_nan_fill_needs_floats():
+    with pytest.raises(ValueError):
+        mpcs_gaps.GapDetector(10, 'nan', np.int16)
+    with pytest.raises(ValueError):
+        mpcs_gaps.GapDetector(10, 'zero')
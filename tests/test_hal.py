@@ -0,0 +1,41 @@
+"""
+The compiled HAL kernels against TDI evaluating the same expression
+one sample at a time.  Needs MDSplus.
+"""
+import numpy as np
+import pytest
+
+MDSplus = pytest.importorskip('MDSplus')
+
+import lift_coil
+import mpcs_contract
+import mpcs_hal
+import mpcs_parameters
+import pickup_coils
+import tof_sensors
+
+def default_hal(model):
+    """ (expr, shape, raw dtype, phys dtype) of the HAL in a model's parts """
+    values = dict((part['path'].upper(), part.get('value')) for part in model.parts)
+    expr = [value for path, value in values.items() if path.endswith(':HAL')][0]
+    shape = mpcs_contract.shape_of(values['.PARAMETERS.IMMUTTABLE:RAW_SHAPE'])
+    if values.get('.SIGNALS:SELECTORS') is not None:
+        shape = (len(mpcs_parameters.value(values['.SIGNALS:SELECTORS'])),)
+    return (expr, shape, mpcs_contract.raw_dtype(values['.PARAMETERS.IMMUTTABLE:RAW_TYPE']),
+            mpcs_contract.raw_dtype(values['.PARAMETERS.IMMUTTABLE:PHYS_TYPE']))
+
+HALS = [default_hal(model) for model in (lift_coil.LIFT_COIL, pickup_coils.PICKUP_COILS, tof_sensors.TOF_SENSORS)] + [
+    ('_out := _in * [1E-4, 1E-4, 2E-4] + [0., .5, -.5]', (3,), np.dtype('<i2'), np.dtype('<f4')),
+    ('_out := _in * 2.5D0 - 1D-3', (3,), np.dtype('<i2'), np.dtype('<f8')),
+    ('_out := (_in + 1E2) / 4.', (4,), np.dtype('<f4'), np.dtype('<f4')),
+    ('_out := -_in * 3 + 1', (2,), np.dtype('<i2'), np.dtype('<i4')),
+]
+
+@pytest.mark.parametrize('expr, shape, dtype, phys_type', HALS)
+@pytest.mark.parametrize('samples', [mpcs_hal.probe, mpcs_hal.full_scale])
+def test_compiled_matches_tdi(expr, shape, dtype, phys_type, samples):
+    block = samples(shape, dtype)
+    expected = np.asarray(mpcs_hal.tdi_hal(expr)(block))
+    got = np.asarray(mpcs_hal.compile_hal(expr)(block))
+    assert got.dtype == expected.dtype
+    np.testing.assert_array_equal(np.broadcast_to(got, expected.shape), expected)
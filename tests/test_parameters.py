@@ -0,0 +1,43 @@
+"""
+load() against load_each() on a scratch tree with one device of each
+model.  Needs MDSplus.
+"""
+import numpy as np
+import pytest
+
+MDSplus = pytest.importorskip('MDSplus')
+
+import mpcs_dispatch
+import mpcs_parameters
+
+TREE = 'mpcs_params'
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory, monkeypatch_module):
+    monkeypatch_module.setenv('%s_path' % (TREE,), str(tmp_path_factory.mktemp('trees')))
+    tree = MDSplus.Tree(TREE, -1, 'New')
+    for model, cls in sorted(mpcs_dispatch.MODELS.items()):
+        cls.Add(tree, model.split('_')[0])
+    tree.write()
+    tree.close()
+    return MDSplus.Tree(TREE, -1, 'ReadOnly')
+
+@pytest.fixture(scope='module')
+def monkeypatch_module():
+    patch = pytest.MonkeyPatch()
+    yield patch
+    patch.undo()
+
+@pytest.mark.parametrize('model', sorted(mpcs_dispatch.MODELS))
+def test_load_matches_load_each(tree, model):
+    head = tree.getNode(model.split('_')[0])
+    bulk = mpcs_parameters.load(head)
+    each = mpcs_parameters.load_each(head)
+    assert bulk
+    assert sorted(bulk) == sorted(each)
+    for path in each:
+        if isinstance(each[path], str):
+            assert bulk[path] == each[path], path
+        else:
+            assert bulk[path].dtype == each[path].dtype, path
+            np.testing.assert_array_equal(bulk[path], each[path], err_msg=path)
@@ -0,0 +1,67 @@
+"""
+RingBuffer reads in order, across the end of the ring, and counts
+the slots overwritten before they were read as lost.
+"""
+import numpy as np
+
+import mpcs_receiver
+
+def write(ring, values):
+    """ what the receiver does for each datagram """
+    for value in values:
+        slot = ring.head % ring.slots
+        ring.data[slot] = value
+        ring.sizes[slot] = value
+        ring.times[slot] = value
+        ring.head += 1
+
+def read(ring, limit=None):
+    data, sizes, times = ring.read(limit)
+    np.testing.assert_array_equal(data[:, 0], sizes)
+    np.testing.assert_array_equal(times, sizes)
+    return sizes.tolist()
+
+def test_read_in_order():
+    ring = mpcs_receiver.RingBuffer(8, 4)
+    write(ring, [1, 2, 3])
+    assert read(ring) == [1, 2, 3]
+    assert read(ring) == []
+    assert (ring.tail, ring.lost) == (3, 0)
+
+def test_read_across_the_end():
+    ring = mpcs_receiver.RingBuffer(8, 4)
+    write(ring, range(1, 7))
+    assert read(ring) == [1, 2, 3, 4, 5, 6]
+    write(ring, range(7, 13))
+    assert ring.occupancy() == 6
+    assert read(ring) == [7, 8, 9, 10, 11, 12]
+    assert ring.lost == 0
+
+def test_read_with_limit():
+    ring = mpcs_receiver.RingBuffer(8, 4)
+    write(ring, range(1, 7))
+    assert read(ring, 4) == [1, 2, 3, 4]
+    assert read(ring, 4) == [5, 6]
+
+def test_overwritten_slots_are_lost():
+    ring = mpcs_receiver.RingBuffer(8, 4)
+    write(ring, range(1, 4))
+    assert read(ring) == [1, 2, 3]
+    write(ring, range(4, 15))
+    assert read(ring) == list(range(7, 15))
+    assert ring.lost == 3
+    write(ring, range(15, 40))
+    assert read(ring, 5) == list(range(32, 37))
+    assert ring.lost == 3 + 17
+    assert read(ring) == [37, 38, 39]
+    assert ring.lost == 20
+
+def test_shared_ring_counts():
+    ring = mpcs_receiver.SharedRing(8, 4)
+    try:
+        assert not ring.running
+        write(ring, range(1, 12))
+        assert read(ring) == list(range(4, 12))
+        assert (ring.head, ring.tail, ring.lost) == (11, 11, 3)
+    finally:
+        ring.close()
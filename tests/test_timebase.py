@@ -0,0 +1,89 @@
+"""
+Resampler and align against signals known at every time, and the
+same points whether a signal comes in one block or many.
+"""
+import numpy as np
+import pytest
+
+import mpcs_timebase
+
+def ramp(t):
+    return np.column_stack((3. * t + 1., -t))
+
+def feed(resampler, seq, block, size):
+    """ (k, values) of resampler fed size samples at a time, then finished """
+    steps = [resampler.apply(seq[i:i + size], block[i:i + size]) for i in range(0, len(seq), size)]
+    steps.append(resampler.finish())
+    return np.concatenate([k for k, values in steps]), np.concatenate([values for k, values in steps])
+
+@pytest.mark.parametrize('rate, phase, grid_rate, grid_phase', [
+    (1000., 0., 300., 0.),
+    (100., 0.0003, 1000., 0.0001),
+    (10000., 0., 500., 0.),
+])
+def test_linear_is_exact_on_a_ramp(rate, phase, grid_rate, grid_phase):
+    seq = np.arange(12345, 12345 + int(rate), dtype=np.int64)
+    resampler = mpcs_timebase.Resampler(rate, phase, grid_rate, grid_phase, 'linear')
+    k, values = feed(resampler, seq, ramp(seq / rate + phase), len(seq))
+    times = k / grid_rate + grid_phase
+    assert times[0] >= seq[0] / rate + phase - 1e-9
+    assert times[-1] <= seq[-1] / rate + phase + 1e-9
+    assert np.all(np.diff(k) == 1)
+    np.testing.assert_allclose(values, ramp(times), rtol=1e-9)
+
+def test_hold():
+    resampler = mpcs_timebase.Resampler(10., 0., 4., 0., 'hold')
+    seq = np.arange(10, 31, dtype=np.int64)
+    k, values = feed(resampler, seq, seq.reshape(-1, 1).astype(float), 21)
+    np.testing.assert_array_equal(k, np.arange(4, 13))
+    np.testing.assert_array_equal(values[:, 0], np.floor(k * 2.5))
+
+def test_break_is_nan():
+    resampler = mpcs_timebase.Resampler(10., 0., 10., 0.05, 'linear')
+    seq = np.r_[0:10, 12:20].astype(np.int64)
+    k, values = feed(resampler, seq, ramp(seq / 10.), 18)
+    missing = np.isnan(values[:, 0])
+    np.testing.assert_array_equal(k[missing], [9, 10, 11])
+
+@pytest.mark.parametrize('method', mpcs_timebase.METHODS)
+@pytest.mark.parametrize('size', [1, 7, 100, 1000])
+def test_streaming_matches_one_shot(method, size):
+    rate, grid_rate = 1000., 130.
+    seq = np.arange(500, 1500, dtype=np.int64)
+    block = np.column_stack((np.sin(seq / 17.), np.cos(seq / 5.)))
+    k, values = feed(mpcs_timebase.Resampler(rate, 0., grid_rate, 0., method), seq, block, len(seq))
+    k_blocks, values_blocks = feed(mpcs_timebase.Resampler(rate, 0., grid_rate, 0., method), seq, block, size)
+    np.testing.assert_array_equal(k_blocks, k)
+    np.testing.assert_allclose(values_blocks, values, rtol=1e-12, atol=1e-12)
+
+def test_decimate_passes_dc():
+    seq = np.arange(0, 2000, dtype=np.int64)
+    k, values = feed(mpcs_timebase.Resampler(1000., 0., 50., 0., 'decimate'), seq, np.full((2000, 1), 2.5), 300)
+    inside = ~np.isnan(values[:, 0])
+    assert inside.sum() > 0.8 * len(k)
+    np.testing.assert_allclose(values[inside], 2.5)
+
+def source(rate, phase, first, count, rows):
+    seq = np.arange(first, first + count)
+    times = seq / rate + phase
+    def chunks():
+        for i in range(0, count, rows):
+            yield times[i:i + rows], ramp(times[i:i + rows])
+    return mpcs_timebase.Source(rate, phase, chunks)
+
+def test_align_over_the_overlap():
+    sources = [source(100., 0., 50, 300, 64), source(10000., 0.00005, 8000, 20000, 3000)]
+    stretches = list(mpcs_timebase.align(sources, 1000.))
+    times = np.concatenate([times for times, blocks in stretches])
+    assert np.all(np.diff(np.round(times * 1000.)) == 1)
+    assert times[0] >= 0.8 and times[-1] <= 2.8 + 0.00005
+    for i in range(2):
+        values = np.concatenate([blocks[i] for times, blocks in stretches])
+        assert len(values) == len(times)
+        np.testing.assert_allclose(values, ramp(times), rtol=1e-9)
+
+def test_align_is_repeatable():
+    sources = [source(100., 0., 0, 200, 50), source(500., 0.001, 0, 1000, 333)]
+    first = [times for times, blocks in mpcs_timebase.align(sources, 200.)]
+    again = [times for times, blocks in mpcs_timebase.align(sources, 200.)]
+    np.testing.assert_array_equal(np.concatenate(first), np.concatenate(again))
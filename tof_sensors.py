@@ -27,6 +27,12 @@ import time
 import datetime
 import numpy as np
 
+import mpcs_acquisition
+import mpcs_contract
+import mpcs_derived
+import mpcs_diagnostics
+import mpcs_parameters
+
 class TOF_SENSORS(MDSplus.Device):
     """
 
@@ -54,11 +60,33 @@ class TOF_SENSORS(MDSplus.Device):
        SDN
 
     Methods:
-       check - make sure Recipe matches, what else
+       check - make sure Recipe matches, compares the FINGERPRINT
+               stored by Add with PCS_PRINT, the one from PCS
+       verify - recompute the FINGERPRINT from the immutable
+               parameters and compare it with the stored one
        configure
        start
        stop
 
+    CONFIG computes SIGNALS:HEIGHT:PINV, the least squares pseudoinverse
+    of the sensor geometry R and PHI, that fits a tilted plane to the
+    surface at Z + HEIGHT of the four sensors, and arms the acquisition
+    so that START only has to set it running; STOP finishes it, see
+    mpcs_acquisition.
+
+    START begins acquisition, the values are stored in
+    SIGNALS:HEIGHT as segments of SIGNALS:SEG_LENGTH samples until STOP,
+    and the bagel height and tilts fitted to each sample in
+    SIGNALS:BAGEL_Z, TILT_X and TILT_Y, with BAGEL_Z in the frame of
+    the sensor positions Z: PINV . (Z + HEIGHT).
+
+    HEIGHT:MIN_10, MAX_10, MEAN_10 and so on to MEAN_1000 hold the min,
+    max and mean of each 10, 100 and 1000 samples, for browsing with
+    mpcs_derived.read().
+
+    The immutable parameters are also typed properties, rate, phase,
+    raw_shape, r, z, phi and so on, loaded once per open of the tree.
+
     debugging() - is debugging enabled.
                   Controlled by environment variable DEBUG_DEVICES
     """
@@ -76,6 +104,18 @@ class TOF_SENSORS(MDSplus.Device):
           'options': ('write_once', 'no_write_shot',),
           'help':'The GUID of this instance.'
         },
+        {
+          'path': ':FINGERPRINT',
+          'type': 'text',
+          'options': ('write_once', 'no_write_shot',),
+          'help':'sha256 of GUID and the immutable parameters, set by Add'
+        },
+        {
+          'path': ':PCS_PRINT',
+          'type': 'text',
+          'options': ('no_write_model', 'write_once',),
+          'help':'FINGERPRINT of the contract as PCS has it, written by PCS before CHECK'
+        },
         {
           'path': ':NAME',
           'type': 'text',
@@ -180,6 +220,30 @@ class TOF_SENSORS(MDSplus.Device):
           'options': ('no_write_shot',),
           'help':'Expression to make values from demand voltages'
         },
+        {
+          'path': '.SIGNALS:HEIGHT:PINV',
+          'type': 'numeric',
+          'options': ('no_write_model',),
+          'help':'Pseudoinverse from Z plus the four heights to bagel z, tilt x and tilt y, set by CONFIG'
+        },
+        {
+          'path': '.SIGNALS:BAGEL_Z',
+          'type': 'signal',
+          'options': ('no_write_model', 'write_once',),
+          'help':'Height of the bagel center in m, fitted to Z plus the four heights'
+        },
+        {
+          'path': '.SIGNALS:TILT_X',
+          'type': 'signal',
+          'options': ('no_write_model', 'write_once',),
+          'help':'Slope of the bagel along PHI = 0'
+        },
+        {
+          'path': '.SIGNALS:TILT_Y',
+          'type': 'signal',
+          'options': ('no_write_model', 'write_once',),
+          'help':'Slope of the bagel along PHI = 90'
+        },
         {
           'path': '.SIGNALS:MAX_MISSING',
           'type': 'numeric',
@@ -201,7 +265,7 @@ class TOF_SENSORS(MDSplus.Device):
         {
           'path': '.COMMS:ADDRESS',
           'type': 'text',
-          'value': '244.0.0.0',
+          'value': '239.0.0.1',
           'options': ('no_write_shot','write_once',),
           'help':'Multicast address'
         },
@@ -242,7 +306,17 @@ class TOF_SENSORS(MDSplus.Device):
           'valueExpr': "Action(Dispatch('S','DONE',50,None),Method(None,'STOP',head))", 
           'options': ('no_write_shot',)
         },
-    ]
+    ] + mpcs_derived.pyramid_parts('.SIGNALS:HEIGHT') + mpcs_diagnostics.parts(100)
+
+    rate = mpcs_parameters.Parameter('RATE', float)
+    phase = mpcs_parameters.Parameter('PHASE', float)
+    raw_shape = mpcs_parameters.Parameter('RAW_SHAPE', mpcs_contract.shape_of)
+    raw_type = mpcs_parameters.Parameter('RAW_TYPE', str)
+    phys_shape = mpcs_parameters.Parameter('PHYS_SHAPE', mpcs_contract.shape_of)
+    phys_type = mpcs_parameters.Parameter('PHYS_TYPE', str)
+    r = mpcs_parameters.Parameter('R', mpcs_parameters.floats)
+    z = mpcs_parameters.Parameter('Z', mpcs_parameters.floats)
+    phi = mpcs_parameters.Parameter('PHI', mpcs_parameters.floats)
 
     debug = None
 
@@ -257,5 +331,30 @@ class TOF_SENSORS(MDSplus.Device):
         import uuid
         head = super(TOF_SENSORS, TOF_SENSORS).Add(*a, **ka)
         head.this_guid.record = str(uuid.uuid4())
+        head.fingerprint.record = mpcs_contract.contract_fingerprint(head, TOF_SENSORS.parts)
         return head
 
+    def CHECK(self, expected=None):
+        mpcs_contract.check(self, expected)
+
+    def VERIFY(self):
+        mpcs_contract.verify(self, TOF_SENSORS.parts)
+
+    def CONFIG(self):
+        import mpcs_dispatch
+        mpcs_dispatch.config(self)
+
+    def arm(self):
+        pinv = mpcs_derived.plane_pinv(self.r, self.phi)
+        self.signals_height_pinv.record = pinv
+        plane = mpcs_derived.Plane(pinv, [self.signals_bagel_z, self.signals_tilt_x, self.signals_tilt_y], self.z)
+        mpcs_acquisition.configure(self, self.signals_height, self.signals_height_hal,
+                                   derived=[plane] + mpcs_derived.pyramid(self.signals_height))
+
+    def START(self):
+        if not mpcs_acquisition.armed(self):
+            self.arm()
+        mpcs_acquisition.start(self)
+
+    def STOP(self):
+        mpcs_acquisition.stop(self)